@@ -1,39 +1,42 @@
 """This script identifies the test case with the highest coverage from a JSON file."""
 
-from quick_sort import measure_sorting_time
-from typing import List, Dict, Any
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Any
 
+# Make the shared modules in the repository root importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-# Path to your test metrics file
-file_path = '../data/newtryingToCompute.json'  # Updated again to new file
-
-# Function to find the test case with the highest coverage
-def find_highest_coverage_test_case(sorted_tests: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Finds the test case with the highest coverage."""
-    # Start with the first test case as the one with the highest coverage
-    highest_coverage_test: Dict[str, Any] = sorted_tests[0]
-
-    # Loop through all test cases to find the one with the largest coverage
-    for test in sorted_tests:
-        if test['coverage'] > highest_coverage_test['coverage']:
-            highest_coverage_test = test  # Update the test case with the highest coverage
-
-    return highest_coverage_test  # Return the test case with the largest coverage
+from metrics_cache import load_columns
+from selection import top_k_indices
 
-# Add a blank line
-print("\n🌟 Results 🌟")
 
-# line for spacing
-print()
-
-# Measure running time and sort by coverage
-sorted_tests_by_coverage: List[Dict[str, Any]] = measure_sorting_time(file_path, 'coverage')
-
-# Find the test case with the highest coverage
-highest_coverage_test_case: Dict[str, Any] = find_highest_coverage_test_case(sorted_tests_by_coverage)
-
-# Print the test case with the highest coverage
-print("\n🚀 Test Case with Highest Coverage:")
-print(f"Test Name: {highest_coverage_test_case['name']}")
-print(f"Coverage: {highest_coverage_test_case['coverage']}")
+# Path to your test metrics file
+file_path = '../data/newtryingToCompute.json'  # Updated again to new file
 
+# Main function to execute the script
+def main():
+    """Prints the test case with the highest coverage."""
+    # Add a blank line
+    print("\n🌟 Results 🌟")
+
+    # line for spacing
+    print()
+
+    # Load the cached metric columns and select the best test without sorting the whole file
+    start_time = time.time()
+    columns = load_columns(file_path)
+    best = top_k_indices(columns['coverage'], 1)[0]
+    highest_coverage_test_case: Dict[str, Any] = {'name': str(columns['name'][best]), 'coverage': float(columns['coverage'][best])}
+    end_time = time.time()
+    print(f"Selecting by coverage took {end_time - start_time} seconds.")
+
+    # Print the test case with the highest coverage
+    print("\n🚀 Test Case with Highest Coverage:")
+    print(f"Test Name: {highest_coverage_test_case['name']}")
+    print(f"Coverage: {highest_coverage_test_case['coverage']}")
+
+# Entry point of the script
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,261 @@
 """provides functions to sort test metrics using the QuickSort algorithm."""
 
-import json # Import the JSON module to handle JSON file operations
+import json # Import the JSON module for its decoding errors
+import sys # Import sys to reach the shared modules in the repository root
 import time # Import the time module to measure execution time
-import random  # Import random for selecting a random pivot in QuickSort
-from typing import List, Dict, Any
+from pathlib import Path
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
+import numpy as np
 
-def quicksort(arr: List[Any]) -> List[Any]:
-    """Sorts an array using the QuickSort algorithm with a random pivot."""
-    if len(arr) <= 1: # Base case if the array has 1 or no elements, it's already sorted
-        return arr
-    else:
-        pivot = random.choice(arr)  # Select a random pivot element from the array
-        left = [x for x in arr if x < pivot]  # Elements less than the pivot
-        right = [x for x in arr if x > pivot]  # Elements greater than the pivot
-        # Recursively sort the left and right partitions and combine them with the pivot
-        return quicksort(left) + [pivot] + quicksort(right)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent)) # Make the repository root importable
 
+from metrics_io import iter_test_metrics
+from profile import timed, timer
+from sort_keys import SortSpec, compile_sort_key, parse_sort_spec
 
-def quicksort_tests(tests: List[Dict[str, Any]], key: str) -> List[Dict[str, Any]]:
-    """Sorts the list of tests based on the specified key, handling both numbers and dictionaries."""
-    if len(tests) <= 1: # Base case if the list has 1 or no elements, it is already sorted
-        return tests
-    else:
-        pivot = tests[0] # Select the first dictionary in the list as the pivot
-        pivot_value = pivot[key] # Get the value of the pivot for the specified key
 
-        # If sorting by 'coverage', extract a single numerical value (sum of all coverage metrics)
-        if isinstance(pivot_value, dict):
-            pivot_value = sum(pivot_value.values())  # Convert dictionary to a single number
+# Ranges this small are finished with insertion sort
+INSERTION_SORT_THRESHOLD = 16
 
-        # Create a list of dictionaries where the key's value is less than or equal to the pivot's value
-        left = [test for test in tests[1:] if (sum(test[key].values()) if isinstance(test[key], dict) else test[key]) <= pivot_value]
-        # Create a list of dictionaries where the key's value is greater than the pivot's value
-        right = [test for test in tests[1:] if (sum(test[key].values()) if isinstance(test[key], dict) else test[key]) > pivot_value]
+# NumPy ranges this small are partitioned as Python lists
+ARRAY_CUTOFF = 256
 
-        # Recursively sort the left and right partitions and combine them with the pivot
-        return quicksort_tests(left, key) + [pivot] + quicksort_tests(right, key)
+# Random pivot fractions drawn from the generator at a time
+PIVOT_BATCH = 1024
 
 
-def load_and_sort_metrics(file_path: str, sort_key: str) -> List[Dict[str, Any]]:
+def _swap(keys: List[Any], items: Optional[List[Any]], i: int, j: int) -> None:
+    """Swaps two positions of the keys and of the items that travel with them."""
+    keys[i], keys[j] = keys[j], keys[i]
+    if items is not None:
+        items[i], items[j] = items[j], items[i]
+
+
+def _insertion_sort(keys: List[Any], items: Optional[List[Any]], lo: int, hi: int) -> Tuple[int, int]:
+    """Sorts keys[lo..hi] in place by inserting each element into the sorted prefix, returning the comparisons and moves."""
+    comparisons = moves = 0
+    for i in range(lo + 1, hi + 1):
+        key = keys[i]
+        item = items[i] if items is not None else None
+        j = i - 1
+        while j >= lo:
+            comparisons += 1
+            if not keys[j] > key:
+                break
+            keys[j + 1] = keys[j] # Shift larger keys one slot to the right
+            if items is not None:
+                items[j + 1] = items[j]
+            moves += 1
+            j -= 1
+        keys[j + 1] = key
+        if items is not None:
+            items[j + 1] = item
+    return comparisons, moves
+
+
+def _heapsort(keys: List[Any], items: Optional[List[Any]], lo: int, hi: int) -> None:
+    """Sorts keys[lo..hi] in place with heapsort, used when partitioning goes too deep."""
+    size = hi - lo + 1
+
+    def sift_down(root: int, end: int) -> None:
+        while 2 * root + 1 < end:
+            child = 2 * root + 1
+            if child + 1 < end and keys[lo + child] < keys[lo + child + 1]:
+                child += 1 # Pick the larger child
+            if keys[lo + root] >= keys[lo + child]:
+                return
+            _swap(keys, items, lo + root, lo + child)
+            root = child
+
+    for root in range(size // 2 - 1, -1, -1): # Build a max heap over the range
+        sift_down(root, size)
+    for end in range(size - 1, 0, -1): # Move the largest key to the back one at a time
+        _swap(keys, items, lo, lo + end)
+        sift_down(0, end)
+
+
+def _partition(keys: List[Any], items: Optional[List[Any]], lo: int, hi: int) -> int:
+    """Partitions keys[lo..hi] around a median-of-three pivot and returns the split point."""
+    mid = (lo + hi) // 2
+    # Order the first, middle and last keys so the middle one is their median
+    if keys[mid] < keys[lo]:
+        _swap(keys, items, lo, mid)
+    if keys[hi] < keys[lo]:
+        _swap(keys, items, lo, hi)
+    if keys[hi] < keys[mid]:
+        _swap(keys, items, mid, hi)
+    pivot = keys[mid]
+
+    # Hoare partitioning: equal keys may land on either side, so duplicates stay balanced
+    i, j = lo, hi
+    while True:
+        while keys[i] < pivot:
+            i += 1
+        while keys[j] > pivot:
+            j -= 1
+        if i >= j:
+            return j
+        _swap(keys, items, i, j)
+        i += 1
+        j -= 1
+
+
+def introsort(keys: List[Any], items: Optional[List[Any]] = None) -> None:
+    """Sorts keys in place, moving items alongside, with an iterative introsort."""
+    if len(keys) <= 1: # A list with 1 or no elements is already sorted
+        return
+    depth_limit = 2 * len(keys).bit_length() # Past this depth the pivots are going badly
+    stack = [(0, len(keys) - 1, 0)] # Ranges still to be sorted, with their depth
+    while stack:
+        lo, hi, depth = stack.pop()
+        if hi - lo + 1 <= INSERTION_SORT_THRESHOLD:
+            _insertion_sort(keys, items, lo, hi)
+        elif depth >= depth_limit:
+            _heapsort(keys, items, lo, hi)
+        else:
+            split = _partition(keys, items, lo, hi)
+            # Push the larger side first so the stack stays logarithmic in size
+            if split - lo > hi - split - 1:
+                stack.append((lo, split, depth + 1))
+                stack.append((split + 1, hi, depth + 1))
+            else:
+                stack.append((split + 1, hi, depth + 1))
+                stack.append((lo, split, depth + 1))
+
+
+class SortCounters:
+    """Operation counts of one three-way quicksort run."""
+
+    __slots__ = ("comparisons", "swaps", "partitions", "max_depth")
+
+    def __init__(self) -> None:
+        self.comparisons = 0
+        self.swaps = 0
+        self.partitions = 0
+        self.max_depth = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        """Returns the counts as a dictionary."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _pivot_fractions(rng: np.random.Generator) -> Iterator[float]:
+    """Yields uniform fractions for choosing pivots, drawn from the generator in batches."""
+    while True:
+        yield from rng.random(PIVOT_BATCH).tolist()
+
+
+def _partition3(keys: Any, items: Any, lo: int, hi: int, pivot: Any, counters: SortCounters) -> Tuple[int, int]:
+    """Dutch flag partitions keys[lo..hi] into smaller, equal and larger runs and returns the equal run's bounds."""
+    lt, i, gt = lo, lo, hi
+    comparisons = swaps = 0
+    while i <= gt:
+        key = keys[i]
+        if key < pivot: # Smaller keys go to the front
+            comparisons += 1
+            keys[lt], keys[i] = key, keys[lt]
+            if items is not None:
+                items[lt], items[i] = items[i], items[lt]
+            swaps += 1
+            lt += 1
+            i += 1
+        elif key > pivot: # Larger keys go to the back, and the key swapped in is looked at next
+            comparisons += 2
+            keys[gt], keys[i] = key, keys[gt]
+            if items is not None:
+                items[gt], items[i] = items[i], items[gt]
+            swaps += 1
+            gt -= 1
+        else: # Equal keys stay in the middle and are never looked at again
+            comparisons += 2
+            i += 1
+    counters.comparisons += comparisons
+    counters.swaps += swaps
+    return lt, gt
+
+
+def _partition3_array(keys: np.ndarray, items: Optional[np.ndarray], lo: int, hi: int, pivot: Any, counters: SortCounters) -> Tuple[int, int]:
+    """Three-way partitions keys[lo..hi] of a NumPy array with whole-range comparisons."""
+    segment = keys[lo:hi + 1]
+    smaller = segment < pivot
+    larger = segment > pivot
+    order = np.concatenate((np.flatnonzero(smaller), np.flatnonzero(~(smaller | larger)), np.flatnonzero(larger)))
+    counters.comparisons += 2 * len(segment)
+    counters.swaps += int(np.count_nonzero(order != np.arange(len(segment)))) # Elements that changed position
+    keys[lo:hi + 1] = segment[order]
+    if items is not None:
+        items[lo:hi + 1] = items[lo:hi + 1][order]
+    n_smaller = int(np.count_nonzero(smaller))
+    return lo + n_smaller, hi - int(np.count_nonzero(larger))
+
+
+def _three_way_sort(keys: Any, items: Any, lo: int, hi: int, depth: int, fractions: Iterator[float], counters: SortCounters) -> None:
+    """Sorts keys[lo..hi] with an explicit stack, finishing small NumPy ranges as plain lists and small lists by insertion."""
+    array = isinstance(keys, np.ndarray)
+    stack = [(lo, hi, depth)] # Ranges still to be sorted, with their depth
+    while stack:
+        lo, hi, depth = stack.pop()
+        counters.max_depth = max(counters.max_depth, depth)
+        if array and hi - lo + 1 <= ARRAY_CUTOFF:
+            # Whole-range NumPy operations cost more than a Python loop on short ranges
+            range_keys = keys[lo:hi + 1].tolist()
+            range_items = items[lo:hi + 1].tolist() if items is not None else None
+            _three_way_sort(range_keys, range_items, 0, hi - lo, depth, fractions, counters)
+            keys[lo:hi + 1] = range_keys
+            if items is not None:
+                items[lo:hi + 1] = range_items
+            continue
+        if not array and hi - lo + 1 <= INSERTION_SORT_THRESHOLD:
+            comparisons, moves = _insertion_sort(keys, items, lo, hi)
+            counters.comparisons += comparisons
+            counters.swaps += moves
+            continue
+        pivot = keys[lo + int(next(fractions) * (hi - lo + 1))] # A random pivot, reproducible from the seed
+        counters.partitions += 1
+        lt, gt = (_partition3_array if array else _partition3)(keys, items, lo, hi, pivot, counters)
+        # Push the larger side first so the smaller one is finished first and the stack stays logarithmic
+        sides = sorted(((lo, lt - 1), (gt + 1, hi)), key=lambda side: side[0] - side[1])
+        for side_lo, side_hi in sides:
+            if side_hi > side_lo:
+                stack.append((side_lo, side_hi, depth + 1))
+
+
+def three_way_quicksort(keys: Any, items: Any = None, seed: Optional[int] = None) -> SortCounters:
+    """Sorts a list or NumPy array in place with seeded random pivots and three-way partitioning, returning the operation counts."""
+    counters = SortCounters()
+    if isinstance(keys, np.ndarray) and items is not None and not isinstance(items, np.ndarray):
+        # The array path moves items with fancy indexing, so other sequences ride along as an object array
+        carried = np.fromiter(items, dtype=object, count=len(items)) # fromiter keeps tuples and lists whole
+        counters = three_way_quicksort(keys, carried, seed)
+        items[:] = carried.tolist() # Sorted in place, like any other items
+        return counters
+    if len(keys) > 1:
+        _three_way_sort(keys, items, 0, len(keys) - 1, 1, _pivot_fractions(np.random.default_rng(seed)), counters)
+    return counters
+
+
+def quicksort(arr: List[Any], seed: Optional[int] = 0) -> List[Any]:
+    """Sorts an array using the QuickSort algorithm, keeping duplicate values."""
+    sorted_arr = list(arr) # Copy so the caller's array is left untouched
+    three_way_quicksort(sorted_arr, seed=seed) # The fixed default seed makes every run do the same work
+    return sorted_arr
+
+
+@timed()
+def quicksort_tests(tests: List[Dict[str, Any]], key: SortSpec) -> List[Dict[str, Any]]:
+    """Sorts the list of tests in place based on the specified key(s), handling both numbers and dictionaries."""
+    sort_key = compile_sort_key(key) # A single key or a lexicographic tuple of several keys
+    keys = [sort_key(test) for test in tests] # Compute every sort key exactly once
+    introsort(keys, tests) # Move the tests alongside their keys
+    return tests
+
+
+def load_and_sort_metrics(file_path: str, sort_key: SortSpec) -> List[Dict[str, Any]]:
     """Loads test metrics from a JSON file and sorts them by the specified key."""
     try:
-        with open(file_path, 'r') as f: # Open the JSON file in read mode
-            test_metrics = json.load(f) # Load the JSON data into a Python list
+        with timer("load"):
+            test_metrics = list(iter_test_metrics(file_path)) # Parse the records incrementally into a list
     except FileNotFoundError: # Handle the case where the file does not exist
         print(f"File not found: {file_path}")
         return []
@@ -51,10 +263,11 @@ def load_and_sort_metrics(file_path: str, sort_key: str) -> List[Dict[str, Any]]
         print(f"Invalid JSON format in file: {file_path}")
         return []
 
-    # Check if the specified key exists in all test metrics
-    if not all(sort_key in test for test in test_metrics):
-        print(f"Key '{sort_key}' not found in all test metrics.")
-        return []
+    # Check if the specified key(s) exist in all test metrics
+    for parts, _ in parse_sort_spec(sort_key):
+        if not all(parts[0] in test for test in test_metrics):
+            print(f"Key '{parts[0]}' not found in all test metrics.")
+            return []
 
     # Debug: Print the loaded data to see if the coverage is present
     # print(test_metrics)  # Check if coverage exists
@@ -64,8 +277,8 @@ def load_and_sort_metrics(file_path: str, sort_key: str) -> List[Dict[str, Any]]
     return sorted_tests
 
 
-# This is called in main.py to benchmark
-def measure_sorting_time(file_path: str, sort_key: str) -> List[Dict[str, Any]]:
+# Times a full load and sort, the cost main.py avoids by selecting the best test instead
+def measure_sorting_time(file_path: str, sort_key: SortSpec) -> List[Dict[str, Any]]:
     """Measures the time it takes to load and sort the metrics from a JSON file."""
     start_time = time.time()  # Record the start time
     sorted_tests = load_and_sort_metrics(file_path, sort_key) # Load and sort the metrics
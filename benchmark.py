@@ -0,0 +1,232 @@
+"""Benchmark the sorting and selection algorithms on synthetic test-metric datasets."""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+# Dataset sizes benchmarked by default
+SIZES = (100, 10_000, 1_000_000)
+
+# Key distributions benchmarked by default
+DISTRIBUTIONS = ("uniform", "skewed", "sorted", "duplicates")
+
+# A median this much slower than the baseline counts as a regression
+REGRESSION_THRESHOLD = 0.10
+
+
+def generate_tests(n: int, distribution: str, seed: int = 0) -> List[Dict[str, Any]]:
+    """Generate n synthetic test-metric records whose coverage follows the given distribution."""
+    rng = np.random.default_rng(seed)
+    if distribution == "uniform":
+        coverage = rng.uniform(0, 1000, n)
+    elif distribution == "skewed":
+        coverage = rng.lognormal(0, 2.5, n)  # most keys are tiny, a few are huge
+    elif distribution == "sorted":
+        coverage = np.sort(rng.uniform(0, 1000, n))
+    elif distribution == "duplicates":
+        coverage = rng.integers(0, 8, n).astype(float)  # only a handful of distinct keys
+    else:
+        raise ValueError(f"Unknown distribution '{distribution}'")
+    duration = rng.exponential(0.01, n)
+    outcomes = np.where(rng.random(n) < 0.95, "passed", "failed")
+    return [
+        {"name": f"tests/test_synthetic.py::test_{i}", "duration": d, "outcome": o, "coverage": c}
+        for i, (d, o, c) in enumerate(zip(duration.tolist(), outcomes.tolist(), coverage.tolist()))
+    ]
+
+
+def _bucket_sort(tests: List[Dict[str, Any]]) -> Callable[[], Any]:
+    from bucket_sort import bucket_sort
+
+    return lambda: bucket_sort(tests, "coverage")
+
+
+def _quicksort_tests(tests: List[Dict[str, Any]]) -> Callable[[], Any]:
+    from Rosa.quick_sort import quicksort_tests
+
+    # quicksort_tests sorts in place, so every run gets a fresh copy
+    return lambda: quicksort_tests(list(tests), "coverage")
+
+
+def _quicksort(tests: List[Dict[str, Any]]) -> Callable[[], Any]:
+    from Rosa.quick_sort import quicksort
+
+    keys = [test["coverage"] for test in tests]
+    return lambda: quicksort(keys)
+
+
+def _parallel_sort(tests: List[Dict[str, Any]]) -> Callable[[], Any]:
+    from parallel_sort import parallel_sort
+
+    return lambda: parallel_sort(tests, "coverage")
+
+
+def _ordered_pairs(fitness: np.ndarray, n_pairs: int, seed: int = 0) -> np.ndarray:
+    """Draw random tournaments that the reference binary_tournament can always play."""
+    from nsga2_algorithm import sampled_pairs
+
+    # with the competitors ranked by fitness and the higher rank always second, the second
+    # competitor wins every pair, ties included; playing the pairs by their first rank then
+    # puts every test's wins before its first loss, so the reference never has to remove a
+    # loser that is missing from its winner list
+    ranked = np.argsort(fitness, kind="stable")
+    P = np.sort(sampled_pairs(len(fitness), n_pairs, seed), axis=1)
+    return ranked[P[np.lexsort((P[:, 1], P[:, 0]))]]
+
+
+def _tournament(batched: bool) -> Callable[[List[Dict[str, Any]]], Callable[[], Any]]:
+    """Build a benchmark for the loop or the batched binary tournament."""
+
+    def setup(tests: List[Dict[str, Any]]) -> Callable[[], Any]:
+        from nsga2_algorithm import binary_tournament, binary_tournament_batched, build_population
+
+        tournament = binary_tournament_batched if batched else binary_tournament
+        pop = build_population(
+            [test["name"] for test in tests],
+            [test["duration"] for test in tests],
+            [test["coverage"] for test in tests],
+        )
+        # both tournaments get the same random pairs, drawn so the reference accepts them
+        P = _ordered_pairs(np.asarray(pop.get("F"), dtype=float).reshape(-1), len(tests))
+
+        def run() -> Any:
+            # the tournaments print the ideal tests, which is not what is being measured
+            with contextlib.redirect_stdout(io.StringIO()):
+                return tournament(pop, P)
+
+        return run
+
+    return setup
+
+
+# name -> (setup that returns the timed callable, largest dataset it is run on)
+BENCHMARKS: Dict[str, Any] = {
+    "bucket_sort": (_bucket_sort, None),
+    "quicksort_tests": (_quicksort_tests, None),
+    "quicksort": (_quicksort, None),
+    "parallel_sort": (_parallel_sort, None),
+    "binary_tournament": (_tournament(batched=False), 10_000),
+    "binary_tournament_batched": (_tournament(batched=True), 10_000),
+}
+
+
+def measure(run: Callable[[], Any], repeats: int, warmup: int) -> Dict[str, float]:
+    """Time a callable after warming it up and summarize the repeats in milliseconds."""
+    for _ in range(warmup):
+        run()
+    samples = []
+    for _ in range(repeats):
+        start = perf_counter_ns()
+        run()
+        samples.append((perf_counter_ns() - start) / 1e6)
+    return {
+        "repeats": repeats,
+        "min_ms": min(samples),
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.fmean(samples),
+        "stdev_ms": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "max_ms": max(samples),
+    }
+
+
+def run_benchmarks(
+    benchmarks: List[str],
+    sizes: List[int],
+    distributions: List[str],
+    repeats: int,
+    warmup: int,
+    seed: int,
+) -> Dict[str, Any]:
+    """Run every benchmark on every dataset and return the results with run metadata."""
+    results = []
+    for size in sizes:
+        for distribution in distributions:
+            tests = generate_tests(size, distribution, seed)
+            for name in benchmarks:
+                setup, max_size = BENCHMARKS[name]
+                if max_size is not None and size > max_size:
+                    continue  # quadratic or object-heavy paths are skipped at scale
+                stats = measure(setup(tests), repeats, warmup)
+                results.append({"benchmark": name, "size": size, "distribution": distribution, **stats})
+                print(f"{name:28} n={size:<9} {distribution:11} median {stats['median_ms']:.3f} ms", file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "warmup": warmup,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float = REGRESSION_THRESHOLD) -> List[Dict[str, Any]]:
+    """Return the benchmarks whose median is slower than the baseline by more than the threshold."""
+    def key(row: Dict[str, Any]) -> Any:
+        return row["benchmark"], row["size"], row["distribution"]
+
+    previous = {key(row): row for row in baseline.get("results", [])}
+    regressions = []
+    for row in results["results"]:
+        old = previous.get(key(row))
+        if old is None:
+            continue
+        ratio = row["median_ms"] / old["median_ms"] if old["median_ms"] > 0 else float("inf")
+        if ratio > 1 + threshold:
+            regressions.append({
+                "benchmark": row["benchmark"],
+                "size": row["size"],
+                "distribution": row["distribution"],
+                "baseline_ms": old["median_ms"],
+                "median_ms": row["median_ms"],
+                "ratio": ratio,
+            })
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the benchmarks from the command line, returning 1 when a regression is found."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--distributions", nargs="+", choices=DISTRIBUTIONS, default=list(DISTRIBUTIONS))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the results")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="allowed slowdown, 0.1 is 10%%")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.benchmarks, args.sizes, args.distributions, args.repeats, args.warmup, args.seed)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Benchmark results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for row in regressions:
+            print(
+                f"REGRESSION {row['benchmark']} n={row['size']} {row['distribution']}: "
+                f"{row['baseline_ms']:.3f} ms -> {row['median_ms']:.3f} ms ({row['ratio']:.2f}x)"
+            )
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
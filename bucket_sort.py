@@ -1,21 +1,72 @@
 """This script identifies the test case with the highest coverage from a JSON file using bucket sort."""
 
-import json
 import os
-from typing import List, Dict, Any
+import random
+from bisect import bisect_right
+from typing import List, Dict, Any, Optional
+
+from metrics_io import iter_test_metrics
+from profile import output_performance_data, timed, timer
+from metrics_cache import load_columns
+from selection import best_test, top_k_indices
+from sort_keys import SortSpec, compile_sort_key, compile_sort_keys
+
+# Function to pick the bucket boundaries from a sample of the keys
+def quantile_boundaries(keys: List[float], bucket_count: int, sample_size: int = 1024, seed: Optional[int] = 0) -> List[float]:
+    """Derive bucket boundaries from the quantiles of a seeded sample of the keys."""
+    if bucket_count < 1:
+        raise ValueError("bucket_count must be at least 1")
+    rng = random.Random(seed)  # The fixed default seed gives every run the same buckets
+    sample = sorted(rng.sample(keys, min(sample_size, len(keys))))  # Sort a bounded sample
+    step = len(sample) / bucket_count
+    # Each boundary is the first key of the next bucket
+    return [sample[int(i * step)] for i in range(1, bucket_count)]
 
 # Function to perform bucket sort on test cases based on a given attribute
-def bucket_sort(data: List[Dict[str, Any]], attribute: str) -> List[Dict[str, Any]]:
-    """Sort a list of dictionaries using bucket sort based on a given attribute."""
-    max_value = max(item[attribute] for item in data)  # Find the maximum value of the attribute
-    buckets = [[] for _ in range(int(max_value) + 1)]  # Create buckets
+@timed()
+def bucket_sort(
+    data: List[Dict[str, Any]],
+    attribute: SortSpec,
+    bucket_count: Optional[int] = None,
+    use_quantiles: bool = False,
+    seed: Optional[int] = 0,
+) -> List[Dict[str, Any]]:
+    """Sort a list of dictionaries using bucket sort based on one or more attributes."""
+    if bucket_count is not None and bucket_count < 1:
+        raise ValueError("bucket_count must be at least 1")
+    if not data:  # Nothing to sort
+        return []
+    accessors = compile_sort_keys(attribute)  # Parse the sort specification once
+    keys = [accessors[0](item) for item in data]  # Bucket on the first (numeric) key
+    if len(accessors) > 1:
+        full_key = compile_sort_key(attribute)
+        tie_keys = [full_key(item) for item in data]  # Later keys only order items within a bucket
+    else:
+        tie_keys = keys
+    min_value, max_value = min(keys), max(keys)  # Find the range of the attribute
+    if min_value == max_value:  # Every first key is equal, so only the later keys matter
+        return [data[position] for position in sorted(range(len(data)), key=tie_keys.__getitem__)]
+    if bucket_count is None:
+        bucket_count = len(data)  # One bucket per item keeps buckets small on average
+    buckets: List[List[int]] = [[] for _ in range(bucket_count)]  # Create buckets of positions
 
-    for item in data:  # Place each item in the appropriate bucket
-        buckets[int(item[attribute])].append(item)
+    if use_quantiles:
+        # Skewed data: bucket edges follow the distribution of the keys
+        boundaries = quantile_boundaries(keys, bucket_count, seed=seed)
+        for position, key in enumerate(keys):
+            buckets[bisect_right(boundaries, key)].append(position)
+    else:
+        # Normalize each key into [0, 1] over [min, max] and scale to a bucket index
+        scale = bucket_count / (max_value - min_value)
+        last = bucket_count - 1
+        for position, key in enumerate(keys):
+            buckets[min(int((key - min_value) * scale), last)].append(position)
 
-    sorted_data = []  # Concatenate all buckets into a sorted list
+    sorted_data = []  # Sort each bucket and concatenate them into a sorted list
     for bucket in buckets:
-        sorted_data.extend(bucket)
+        if len(bucket) > 1:
+            bucket.sort(key=tie_keys.__getitem__)  # Stable, so equal keys keep their input order
+        sorted_data.extend(data[position] for position in bucket)
 
     return sorted_data  # Return the sorted list
 
@@ -24,18 +75,13 @@ def load_data(file_path: str) -> List[Dict[str, Any]]:
     """Load data from a JSON file."""
     if not os.path.exists(file_path):  # Check if the file exists
         raise FileNotFoundError(f"File not found: {file_path}")
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-    return data  # Return the loaded data
+    with timer("load"):
+        return list(iter_test_metrics(file_path))  # Parse the records incrementally
 
 # Function to find the test case with the highest coverage
 def find_highest_coverage_test_case(sorted_tests: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Finds the test case with the highest coverage."""
-    highest_coverage_test: Dict[str, Any] = sorted_tests[0]  # Start with the first test case
-    for test in sorted_tests:  # Loop through all test cases
-        if test['coverage'] > highest_coverage_test['coverage']:
-            highest_coverage_test = test  # Update the test case with the highest coverage
-    return highest_coverage_test  # Return the test case with the largest coverage
+    return best_test(sorted_tests, 'coverage')  # One pass, the first of equal tests wins
 
 # Main function to execute the script
 def main():
@@ -44,14 +90,15 @@ def main():
     # Debugging: Print the absolute path being used
     print(f"Looking for file at: {os.path.abspath(file_path)}")
 
-    try:
-        data = load_data(file_path)  # Load the test metrics data
-    except FileNotFoundError as e:
-        print(e)
+    if not os.path.exists(file_path):  # Check if the file exists
+        print(f"File not found: {file_path}")
         return
 
-    sorted_tests_by_coverage: List[Dict[str, Any]] = bucket_sort(data, 'coverage')  # Sort by coverage
-    highest_coverage_test_case: Dict[str, Any] = find_highest_coverage_test_case(sorted_tests_by_coverage)  # Find the highest coverage
+    # Load the cached columns (parsed once per file version) and select on the coverage column
+    columns = load_columns(file_path)
+    with timer("select"):
+        best = top_k_indices(columns['coverage'], 1)[0]
+    highest_coverage_test_case: Dict[str, Any] = {'name': str(columns['name'][best]), 'coverage': float(columns['coverage'][best])}
 
     # Print the results
     print("\n🌟 Results 🌟")
@@ -59,6 +106,9 @@ def main():
     print(f"Test Name: {highest_coverage_test_case['name']}")
     print(f"Coverage: {highest_coverage_test_case['coverage']}")
 
+    # Print where the time went
+    output_performance_data(label="⏱")
+
 # Entry point of the script
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""Run several test selection backends on one loaded dataset and report the results as JSON."""
+
+import argparse
+import json
+import sys
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from metric_records import MetricArray, MetricRecord
+from metrics_cache import is_nsga_format, load_columns
+
+# name -> function(dataset, key, k, largest) returning the backend's selection
+BACKENDS: Dict[str, Callable[..., Any]] = {}
+
+
+def backend(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Register a selection backend under a name."""
+
+    def register(func: Callable[..., Any]) -> Callable[..., Any]:
+        BACKENDS[name] = func
+        return func
+
+    return register
+
+
+class Dataset:
+    """Metric columns loaded once, with the record view built only if a backend asks for it."""
+
+    def __init__(self, source: str, rebuild: bool = False) -> None:
+        self.source = source
+        self.columns = load_columns(source, rebuild=rebuild)
+        self._records: Optional[List[MetricRecord]] = None
+
+    def __len__(self) -> int:
+        return len(self.columns["name"])
+
+    @property
+    def records(self) -> List[MetricRecord]:
+        """The tests as slotted records, which the sorting modules index like dictionaries."""
+        if self._records is None:
+            self._records = MetricArray.from_columns(self.columns).to_records()
+        return self._records
+
+
+def _summarize(tests: List[MetricRecord], key: str) -> List[Dict[str, Any]]:
+    """Keep the name and the selection key of each chosen test."""
+    return [{"name": test["name"], key: test[key]} for test in tests]
+
+
+@backend("bucket")
+def run_bucket(dataset: Dataset, key: str, k: int, largest: bool) -> List[Dict[str, Any]]:
+    """Bucket sort the records by the key and keep the first k."""
+    from bucket_sort import bucket_sort
+
+    ordered = bucket_sort(dataset.records, f"-{key}" if largest else key)
+    return _summarize(ordered[:k], key)
+
+
+@backend("quick")
+def run_quick(dataset: Dataset, key: str, k: int, largest: bool) -> List[Dict[str, Any]]:
+    """Introsort a copy of the records by the key and keep the first k."""
+    from Rosa.quick_sort import quicksort_tests
+
+    ordered = quicksort_tests(list(dataset.records), f"-{key}" if largest else key)
+    return _summarize(ordered[:k], key)
+
+
+@backend("parallel")
+def run_parallel(dataset: Dataset, key: str, k: int, largest: bool) -> List[Dict[str, Any]]:
+    """Sample sort the key column across processes and keep the first k."""
+    from parallel_sort import parallel_argsort
+
+    columns = dataset.columns
+    values = np.asarray(columns[key], dtype=np.float64)
+    order = parallel_argsort([-values if largest else values])
+    return [{"name": str(columns["name"][i]), key: float(values[i])} for i in order[:k]]
+
+
+@backend("topk")
+def run_topk(dataset: Dataset, key: str, k: int, largest: bool) -> List[Dict[str, Any]]:
+    """Select the k best tests straight from the key column."""
+    from selection import top_k_indices
+
+    columns = dataset.columns
+    chosen = top_k_indices(columns[key], k, largest)
+    return [{"name": str(columns["name"][i]), key: float(columns[key][i])} for i in chosen]
+
+
+@backend("nsga2")
+def run_nsga2(dataset: Dataset, key: str, k: int, largest: bool) -> Dict[str, Any]:
+    """Rank the tests into Pareto fronts of short duration and high coverage."""
+    from nsga2_algorithm import rank_tests
+
+    columns = dataset.columns
+    fronts = rank_tests(columns["name"], columns["duration"], columns["coverage"])
+    return {"front_sizes": [len(front) for front in fronts], "pareto_optimal": [str(name) for name in fronts[0]]}
+
+
+@backend("tournament")
+def run_tournament(dataset: Dataset, key: str, k: int, largest: bool) -> Dict[str, Any]:
+    """Play binary tournaments on coverage per second and report the tests that never lost."""
+    from fitness import fitness_column
+    from nsga2_algorithm import run_tournaments, tournament_pairs
+
+    if not is_nsga_format(dataset.source):
+        # other formats may already store a ratio in coverage, which must not be divided again
+        raise ValueError(f"The tournament needs covered lines per test, {dataset.source} is not in the NSGA format")
+    P = tournament_pairs(len(dataset), seed=0)
+    S, ideal = run_tournaments(fitness_column(dataset.source), dataset.columns["name"], P)
+    return {"tournaments": int(len(P)), "ideal_tests": ideal}
+
+
+def run_backends(dataset: Dataset, names: List[str], key: str, k: int, largest: bool) -> Dict[str, Any]:
+    """Run each named backend on the dataset and time it."""
+    results = {}
+    for name in names:
+        start = perf_counter_ns()
+        result = BACKENDS[name](dataset, key, k, largest)
+        results[name] = {"elapsed_ms": (perf_counter_ns() - start) / 1e6, "result": result}
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Load the dataset once, run the selected backends and print or save their results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("source", nargs="?", default="data/newtryingToCompute.json", help="metrics file to load")
+    parser.add_argument("--backends", nargs="+", choices=sorted(BACKENDS), default=["bucket", "quick", "topk"])
+    parser.add_argument("--key", choices=["coverage", "duration"], default="coverage", help="column to select by")
+    parser.add_argument("--k", type=int, default=1, help="number of tests to select")
+    parser.add_argument("--smallest", action="store_true", help="select the smallest values instead of the largest")
+    parser.add_argument("--rebuild", action="store_true", help="reparse the metrics file even if its cache is fresh")
+    parser.add_argument("--output", help="write the JSON results here instead of printing them")
+    parser.add_argument("--profile", action="store_true", help="print where the time went after the run")
+    args = parser.parse_args(argv)
+    if "tournament" in args.backends and not is_nsga_format(args.source):
+        parser.error("the tournament backend needs an NSGA-format source such as data/nsga.json")
+
+    start = perf_counter_ns()
+    dataset = Dataset(args.source, rebuild=args.rebuild)
+    report = {
+        "source": args.source,
+        "tests": len(dataset),
+        "key": args.key,
+        "k": args.k,
+        "largest": not args.smallest,
+        "load_ms": (perf_counter_ns() - start) / 1e6,
+        "backends": run_backends(dataset, args.backends, args.key, args.k, not args.smallest),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.profile:
+        # rich is only imported when the report is printed
+        from profile import output_performance_data
+
+        output_performance_data(console=None, label="⏱")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
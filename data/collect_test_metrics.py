@@ -1,10 +1,22 @@
 """Script to collect test execution metrics for NSGA-II comparison research."""
 
+import argparse
 import json
+import os
+import sys
 import time
 from pathlib import Path
-from typing import Dict, List, Any
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Set, Tuple
 import subprocess
+import tempfile
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from metrics_io import file_digest, iter_test_metrics, write_test_metrics
+from suite_reduction import CoverageBitsets
 
 def run_tests_with_coverage() -> Dict[str, Any]:
     """Run tests with coverage and JSON report enabled."""
@@ -53,13 +65,200 @@ def run_tests_with_coverage() -> Dict[str, Any]:
         print(f"Error executing tests: {e}")
         return {}
 
+# Base command that runs the test suite
+TEST_COMMAND = ["poetry", "run", "task", "test"]
+
+def collect_test_ids() -> List[str]:
+    """Collect the node ids of every test without running them."""
+    result = subprocess.run(TEST_COMMAND + ["--collect-only", "-q"], capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"Error collecting tests: {result.stderr}")
+        return []
+    # Node ids are the lines that name a test inside a file
+    return [line.strip() for line in result.stdout.splitlines() if "::" in line]
+
+def shard_test_ids(test_ids: List[str], shards: int) -> List[List[str]]:
+    """Split the test ids round-robin into at most the given number of non-empty shards."""
+    return [test_ids[i::shards] for i in range(min(shards, len(test_ids)))]
+
+def run_shard(index: int, test_ids: List[str], shard_dir: Path) -> Tuple[int, subprocess.CompletedProcess]:
+    """Run one shard of tests with its own coverage data file and reports, all kept in shard_dir."""
+    # The ids go in an @file (pytest 8.2+), since thousands of node ids can exceed the argv limit
+    ids_file = shard_dir / f"test_ids.shard{index}.txt"
+    ids_file.write_text("\n".join(test_ids) + "\n")
+    cmd = TEST_COMMAND + [
+        "--cov",
+        f"--cov-report=json:{shard_dir / f'coverage.shard{index}.json'}",
+        "--json-report",
+        f"--json-report-file={shard_dir / f'test_report.shard{index}.json'}",
+        f"@{ids_file}",
+    ]
+    # A separate data file keeps concurrent coverage runs from overwriting each other
+    env = dict(os.environ, COVERAGE_FILE=str(shard_dir / f".coverage.shard{index}"))
+    return index, subprocess.run(cmd, capture_output=True, text=True, env=env)
+
+def read_json_file(path: str, default: Any) -> Any:
+    """Read a JSON file, warning and falling back to a default when it is missing."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"Warning: {path} not found.")
+        return default
+
+def merge_coverage(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge per-shard coverage data into one coverage.json structure."""
+    files: Dict[str, Dict[str, Any]] = {}
+    for part in parts:
+        for file_path, file_data in part.get("files", {}).items():
+            merged = files.setdefault(file_path, {**file_data, "summary": dict(file_data.get("summary", {})), "lines": {}})
+            for line_num, line_data in file_data.get("lines", {}).items():
+                target = merged["lines"].get(line_num)
+                if target is None:
+                    # First shard to report this line: copy the lists so later merges do not alias them
+                    merged["lines"][line_num] = {
+                        **line_data,
+                        "tests": list(line_data.get("tests", [])),
+                        "branches": [{**branch, "tests": list(branch.get("tests", []))} for branch in line_data.get("branches") or []],
+                    }
+                    continue
+                # The line is covered by the union of the shards' tests
+                target["tests"].extend(test for test in line_data.get("tests", []) if test not in target["tests"])
+                # and it is only missing if every shard missed it
+                target["missing"] = bool(target.get("missing")) and bool(line_data.get("missing"))
+                for position, branch in enumerate(line_data.get("branches") or []):
+                    if position < len(target["branches"]):
+                        branch_tests = target["branches"][position]["tests"]
+                        branch_tests.extend(test for test in branch.get("tests", []) if test not in branch_tests)
+                    else:
+                        target["branches"].append({**branch, "tests": list(branch.get("tests", []))})
+
+    # Recompute the line counts of each summary from the merged lines
+    totals = {"covered_lines": 0, "num_statements": 0, "missing_lines": 0}
+    for file_data in files.values():
+        summary = file_data["summary"]
+        if file_data["lines"]:
+            statements = summary.get("num_statements", len(file_data["lines"]))
+            missing = sum(1 for line_data in file_data["lines"].values() if line_data.get("missing"))
+            summary["missing_lines"] = missing
+            summary["covered_lines"] = statements - missing
+            summary["percent_covered"] = (statements - missing) / statements * 100 if statements > 0 else 100.0
+        for key in totals:
+            totals[key] += summary.get(key, 0)
+    totals["percent_covered"] = totals["covered_lines"] / totals["num_statements"] * 100 if totals["num_statements"] > 0 else 100.0
+
+    merged_coverage = {**parts[0], "files": files, "totals": totals} if parts else {"files": files, "totals": totals}
+    return merged_coverage
+
+def merge_reports(parts: List[Dict[str, Any]], test_ids: List[str]) -> Dict[str, Any]:
+    """Merge per-shard test reports, keeping the tests in collection order."""
+    order = {test_id: position for position, test_id in enumerate(test_ids)}
+    tests = [test for part in parts for test in part.get("tests", [])]
+    tests.sort(key=lambda test: order.get(test.get("nodeid"), len(order)))
+    return {"tests": tests}
+
+def run_tests_sharded(workers: int, test_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Run the tests (all of them by default) split across concurrent worker processes and merge their results."""
+    start_time = time.time()
+
+    if test_ids is None:
+        test_ids = collect_test_ids()
+    shards = shard_test_ids(test_ids, workers)
+    if not shards:
+        print("Error running tests: no tests were collected.")
+        return {}
+
+    # The shard outputs live in a temporary directory that is removed once they are merged
+    with tempfile.TemporaryDirectory(prefix="test_shards_") as tmp:
+        shard_dir = Path(tmp)
+
+        # Each shard is an independent subprocess, so threads are enough to keep them all running
+        try:
+            with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+                results = list(executor.map(run_shard, range(len(shards)), shards, [shard_dir] * len(shards)))
+        except Exception as e:
+            print(f"Error executing tests: {e}")
+            return {}
+
+        for index, result in results:
+            if result.returncode != 0:
+                print(f"Error running tests in shard {index}: {result.stderr}")
+                return {}
+
+        end_time = time.time()
+
+        # Read every shard's outputs and merge them into the serial layout
+        coverage_parts = [read_json_file(str(shard_dir / f"coverage.shard{index}.json"), {}) for index in range(len(shards))]
+        report_parts = [read_json_file(str(shard_dir / f"test_report.shard{index}.json"), {"tests": []}) for index in range(len(shards))]
+
+    # pytest before 8.2 takes the @file argument for a path, collects nothing and still succeeds
+    for index, (shard, report) in enumerate(zip(shards, report_parts)):
+        if not report.get("tests"):
+            print(
+                f"Error running tests in shard {index}: none of its {len(shard)} test(s) ran. "
+                "Passing test ids as @file needs pytest 8.2 or newer."
+            )
+            return {}
+
+    coverage_data = merge_coverage(coverage_parts)
+    test_report = merge_reports(report_parts, test_ids)
+
+    # Leave the merged files where the serial run would have written them
+    with open("coverage.json", "w") as f:
+        json.dump(coverage_data, f)
+    with open("test_report.json", "w") as f:
+        json.dump(test_report, f)
+
+    return {
+        "total_time": end_time - start_time,
+        "test_results": test_report,
+        "coverage_data": coverage_data
+    }
+
 def normalize_path(path: str) -> str:
     """Normalize a file path for comparison."""
     return str(Path(path).resolve())
 
+def build_coverage_index(coverage_data: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, List[int]]]]:
+    """Walk the coverage data once and index the covered lines and branches of every test per file."""
+    files = []
+    index: Dict[str, Dict[str, List[int]]] = defaultdict(dict)
+
+    for file_path, file_data in coverage_data.get("files", {}).items():
+        missing_lines = 0
+        for line_data in file_data.get("lines", {}).values():
+            line_tests = set(line_data.get("tests", []))
+            if line_data.get("missing"):
+                missing_lines += 1
+            # Count the line for every test that covers it
+            for test_name in line_tests:
+                counts = index[test_name].setdefault(file_path, [0, 0, 0])
+                counts[0] += 1
+                if line_data.get("missing"):
+                    counts[2] += 1  # Missing lines this test covers are not missing for it
+            # Branches only count for tests that also cover their line
+            for branch in line_data.get("branches") or []:
+                for test_name in line_tests.intersection(branch.get("tests", [])):
+                    index[test_name][file_path][1] += 1
+
+        files.append({
+            "path": file_path,
+            "normalized": normalize_path(file_path),  # Resolve each path only once
+            "total_lines": file_data.get("summary", {}).get("num_statements", 0),
+            "total_branches": file_data.get("summary", {}).get("num_branches", 0),
+            "missing_lines": missing_lines,
+        })
+
+    return files, index
+
 def extract_test_metrics(data: Dict[str, Any]) -> List[Dict[str, Any]]:
     """Extract relevant metrics from test results."""
     metrics = []
+
+    # Index the coverage data once instead of rescanning it for every test
+    coverage_data = data["coverage_data"]
+    files, index = build_coverage_index(coverage_data) if isinstance(coverage_data, dict) else ([], {})
+    matching_files: Dict[str, List[Dict[str, Any]]] = {}
     
     # Get test results from the report
     for test in data["test_results"].get("tests", []):
@@ -81,74 +280,177 @@ def extract_test_metrics(data: Dict[str, Any]) -> List[Dict[str, Any]]:
         }
         
         # Update coverage information from coverage data
-        coverage_data = data["coverage_data"]
         if isinstance(coverage_data, dict):
             # Extract the test file path from the test name
             test_file = test_name.split("::")[0]
-            test_file_normalized = normalize_path(test_file)
+            if test_file not in matching_files:
+                test_file_normalized = normalize_path(test_file)
+                matching_files[test_file] = [
+                    file_info for file_info in files if test_file_normalized in file_info["normalized"]
+                ]
+            test_index = index.get(test_name, {})
             
             # Look for coverage data in the corresponding file
-            for file_path, file_data in coverage_data.get("files", {}).items():
-                file_path_normalized = normalize_path(file_path)
-                if test_file_normalized in file_path_normalized:
-                    # Get total lines and branches in the file
-                    total_lines = file_data.get("summary", {}).get("num_statements", 0)
-                    total_branches = file_data.get("summary", {}).get("num_branches", 0)
-                    
-                    # Count lines and branches covered by this test
-                    covered_lines = 0
-                    covered_branches = 0
-                    missing_lines = 0
-                    
-                    # Process each line in the file
-                    for line_num, line_data in file_data.get("lines", {}).items():
-                        # Check if this test covers this line
-                        if test_name in line_data.get("tests", []):
-                            covered_lines += 1
-                            # Check branch coverage
-                            if line_data.get("branches"):
-                                for branch in line_data["branches"]:
-                                    if test_name in branch.get("tests", []):
-                                        covered_branches += 1
-                        # Count missing lines
-                        elif line_data.get("missing"):
-                            missing_lines += 1
-                    
-                    # Update test metrics with coverage information
-                    test_metrics["coverage"].update({
-                        "lines": covered_lines,
-                        "branches": covered_branches,
-                        "missing_lines": missing_lines,
-                        "total_lines": total_lines,
-                        "total_branches": total_branches,
-                        "line_coverage_percentage": (covered_lines / total_lines * 100) if total_lines > 0 else 0,
-                        "branch_coverage_percentage": (covered_branches / total_branches * 100) if total_branches > 0 else 0
-                    })
-                    
-                    # Print debug information
-                    print(f"Found coverage for test {test_name}:")
-                    print(f"  File: {file_path}")
-                    print(f"  Covered lines: {covered_lines}/{total_lines}")
-                    print(f"  Covered branches: {covered_branches}/{total_branches}")
+            for file_info in matching_files[test_file]:
+                file_path = file_info["path"]
+                total_lines = file_info["total_lines"]
+                total_branches = file_info["total_branches"]
+
+                # Lines and branches covered by this test, taken from the index
+                covered_lines, covered_branches, covered_missing = test_index.get(file_path, (0, 0, 0))
+                missing_lines = file_info["missing_lines"] - covered_missing
+                
+                # Update test metrics with coverage information
+                test_metrics["coverage"].update({
+                    "lines": covered_lines,
+                    "branches": covered_branches,
+                    "missing_lines": missing_lines,
+                    "total_lines": total_lines,
+                    "total_branches": total_branches,
+                    "line_coverage_percentage": (covered_lines / total_lines * 100) if total_lines > 0 else 0,
+                    "branch_coverage_percentage": (covered_branches / total_branches * 100) if total_branches > 0 else 0
+                })
+                
+                # Print debug information
+                print(f"Found coverage for test {test_name}:")
+                print(f"  File: {file_path}")
+                print(f"  Covered lines: {covered_lines}/{total_lines}")
+                print(f"  Covered branches: {covered_branches}/{total_branches}")
         
         metrics.append(test_metrics)
     
     return metrics
 
 def save_metrics(metrics: List[Dict[str, Any]], output_file: str):
-    """Save collected metrics to a JSON file."""
-    with open(output_file, 'w') as f:
-        json.dump(metrics, f, indent=2)
+    """Save collected metrics to a JSON file, or to JSON Lines for a .jsonl path."""
+    write_test_metrics(metrics, output_file)
+
+def tracked_files(coverage_data: Dict[str, Any], test_names: List[str]) -> Set[str]:
+    """List the files whose changes can affect the metrics: every covered file and every test file."""
+    return set(coverage_data.get("files", {})) | {test_name.split("::")[0] for test_name in test_names}
+
+def file_hashes(paths: Set[str]) -> Dict[str, Optional[str]]:
+    """Hash the given files, recording None for files that no longer exist."""
+    return {path: file_digest(path) if os.path.exists(path) else None for path in sorted(paths)}
+
+def save_state(output_dir: Path, coverage_data: Dict[str, Any], test_names: List[str]):
+    """Store the coverage map, its per-test bitsets and the source hashes the next incremental run compares against."""
+    with open(output_dir / "coverage.json", "w") as f:
+        json.dump(coverage_data, f)
+    with open(output_dir / "state.json", "w") as f:
+        json.dump({"hashes": file_hashes(tracked_files(coverage_data, test_names))}, f, indent=2)
+    # Per-test covered-line bitsets for the suite reduction, which counts cannot support
+    CoverageBitsets.from_coverage(coverage_data).save(output_dir / "coverage_bitsets.json")
 
-def main():
+def load_state(output_dir: Path) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, Any], Dict[str, Optional[str]]]]:
+    """Load the previous metrics, coverage map and hashes, or None when any of them is missing."""
+    try:
+        metrics = list(iter_test_metrics(output_dir / "test_metrics.json"))
+        with open(output_dir / "coverage.json", "r") as f:
+            coverage_data = json.load(f)
+        with open(output_dir / "state.json", "r") as f:
+            hashes = json.load(f)["hashes"]
+    except (OSError, ValueError, KeyError):
+        return None
+    return metrics, coverage_data, hashes
+
+def affected_tests(
+    coverage_data: Dict[str, Any],
+    hashes: Dict[str, Optional[str]],
+    test_ids: List[str],
+    previous_names: Set[str],
+) -> Tuple[Set[str], Set[str]]:
+    """Find the changed files and the tests that must re-run: new tests and tests touching a changed file."""
+    changed = {path for path, digest in file_hashes(set(hashes)).items() if digest != hashes[path]}
+
+    # The per-test coverage index says which files each test executed
+    _, index = build_coverage_index(coverage_data)
+    rerun = set()
+    for test_name in test_ids:
+        covered = set(index.get(test_name, {})) | {test_name.split("::")[0]}
+        if test_name not in previous_names or covered & changed:
+            rerun.add(test_name)
+    return rerun, changed
+
+def strip_coverage(coverage_data: Dict[str, Any], tests: Set[str], changed: Set[str]) -> Dict[str, Any]:
+    """Remove re-run tests and changed files from a coverage map so a partial run can be merged into it."""
+    files = {}
+    for file_path, file_data in coverage_data.get("files", {}).items():
+        if file_path in changed:
+            continue  # Its line numbers are stale, the partial run reports it afresh
+        lines = {}
+        for line_num, line_data in file_data.get("lines", {}).items():
+            line_tests = line_data.get("tests", [])
+            kept = [test for test in line_tests if test not in tests]
+            lines[line_num] = {
+                **line_data,
+                "tests": kept,
+                # A line only the re-run tests executed counts as missing until they report it again
+                "missing": bool(line_data.get("missing")) or (bool(line_tests) and not kept),
+                "branches": [
+                    {**branch, "tests": [test for test in branch.get("tests", []) if test not in tests]}
+                    for branch in line_data.get("branches") or []
+                ],
+            }
+        files[file_path] = {**file_data, "lines": lines}
+    return {**coverage_data, "files": files}
+
+def collect_incremental(output_dir: Path, workers: int) -> Optional[List[Dict[str, Any]]]:
+    """Re-run only the tests affected by changed files and merge them into the stored metrics."""
+    state = load_state(output_dir)
+    if state is None:
+        print("No previous metrics found, running the full test suite.")
+        return None
+    previous_metrics, previous_coverage, hashes = state
+
+    test_ids = collect_test_ids()
+    if not test_ids:
+        return None
+    previous_names = {test["name"] for test in previous_metrics}
+    rerun, changed = affected_tests(previous_coverage, hashes, test_ids, previous_names)
+    print(f"{len(changed)} changed file(s), re-running {len(rerun)} of {len(test_ids)} test(s).")
+
+    # Deleted tests leave the coverage map along with the ones being re-measured
+    removed = previous_names - set(test_ids)
+    coverage_data = strip_coverage(previous_coverage, rerun | removed, changed)
+
+    # Unaffected tests keep their stored duration and outcome
+    reports = {
+        test["name"]: {"nodeid": test["name"], "duration": test["duration"], "outcome": test["outcome"]}
+        for test in previous_metrics
+    }
+    if rerun:
+        data = run_tests_sharded(max(workers, 1), [test_id for test_id in test_ids if test_id in rerun])
+        if not data:
+            return None
+        coverage_data = merge_coverage([coverage_data, data["coverage_data"]])
+        reports.update((test["nodeid"], test) for test in data["test_results"].get("tests", []))
+
+    # Re-derive every test's metrics from the merged coverage map, exactly as a full run would
+    test_report = {"tests": [reports[test_id] for test_id in test_ids if test_id in reports]}
+    metrics = extract_test_metrics({"test_results": test_report, "coverage_data": coverage_data})
+    save_state(output_dir, coverage_data, test_ids)
+    return metrics
+
+def main(argv=None):
     """Main function to collect and save test metrics."""
+    parser = argparse.ArgumentParser(description="Collect per-test duration and coverage metrics.")
+    parser.add_argument("--workers", type=int, default=1, help="number of concurrent test shards")
+    parser.add_argument("--incremental", action="store_true", help="only re-run tests affected by changed files")
+    args = parser.parse_args(argv)
+
     # Create output directory if it doesn't exist
     output_dir = Path("test_metrics")
     output_dir.mkdir(exist_ok=True)
     
-    # Collect metrics
-    data = run_tests_with_coverage()
-    metrics = extract_test_metrics(data)
+    metrics = collect_incremental(output_dir, args.workers) if args.incremental else None
+    if metrics is None:
+        # Collect metrics, sharded across workers when more than one is requested
+        data = run_tests_sharded(args.workers) if args.workers > 1 else run_tests_with_coverage()
+        if not data:
+            sys.exit("No test metrics were collected.")  # The error is printed above, fail instead of saving nothing
+        metrics = extract_test_metrics(data)
+        save_state(output_dir, data["coverage_data"], [test["name"] for test in metrics])
     
     # Save metrics
     output_file = output_dir / "test_metrics.json"
@@ -1,23 +1,26 @@
+import argparse
 import json
 import os
+import sys
+from pathlib import Path
 
-def map_coverage_percent_to_tests(coverage_file, test_metrics_file, output_file):
+# Make the shared modules in the repository root importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fitness import coverage_per_second
+from metrics_io import iter_test_metrics, write_test_metrics
+from profile import timed
+
+def load_module_coverage(coverage_file):
     """
-    Maps coverage data from coverage.json to test_metrics.json.
-    Each test gets the covered_lines/duration ratio from its corresponding module.
-    
+    Parses coverage.json once and indexes the summary of every chasten module by name.
+
     Args:
         coverage_file: Path to coverage.json file
-        test_metrics_file: Path to test_metrics.json file
-        output_file: Path to save the computed test metrics
     """
-    # Load the coverage and test metrics files
     with open(coverage_file, 'r') as f:
         coverage_data = json.load(f)
-    
-    with open(test_metrics_file, 'r') as f:
-        test_metrics = json.load(f)
-    
+
     # Create mapping from module names to their coverage data
     module_coverage = {}
     for file_path, data in coverage_data["files"].items():
@@ -30,89 +33,132 @@ def map_coverage_percent_to_tests(coverage_file, test_metrics_file, output_file)
                 "missing_lines": data["summary"]["missing_lines"],
                 "excluded_lines": data["summary"]["excluded_lines"]
             }
-    
-    # Update each test metric with the computed covered_lines/duration ratio
-    for test in test_metrics:
-        test_file = test["name"].split("::")[0]
-        module_name = os.path.basename(test_file).replace("test_", "").replace(".py", "")
-        
-        # For failed or skipped tests, set coverage to 0
-        if test["outcome"] != "passed":
-            test["coverage"] = 0
-            continue
-        
-        # If we have coverage data for this module, compute covered_lines/duration
-        if module_name in module_coverage:
-            # Avoid division by zero by checking duration
-            if test["duration"] > 0:
-                test["coverage"] = test["duration"] / module_coverage[module_name]["covered_lines"] 
-            else:
-                test["coverage"] = 0
-        else:
-            # Default to 0 if no coverage data is found
-            test["coverage"] = 0
-    
-    # Save the computed test metrics
-    with open(output_file, 'w') as f:
-        json.dump(test_metrics, f, indent=2)
-    
+    return module_coverage
+
+def ratio_record(test, module):
+    """
+    Gives a test the covered_lines/duration ratio of its module, or 0 when there is none.
+
+    Args:
+        test: Test metrics record, updated in place
+        module: Coverage summary of the test's module, or None
+    """
+    # For failed or skipped tests, set coverage to 0
+    if test["outcome"] != "passed":
+        test["coverage"] = 0
+    # The shared fitness definition, lines covered per second, returns 0 without a duration
+    elif module is not None:
+        test["coverage"] = coverage_per_second(test["duration"], module["covered_lines"])
+    else:
+        # Default to 0 if no coverage data is found
+        test["coverage"] = 0
+    return test
+
+def nsga_row(test, module):
+    """
+    Builds the [name, duration, covered_lines] row used by the NSGA experiment.
+
+    Args:
+        test: Test metrics record
+        module: Coverage summary of the test's module, or None
+    """
+    coverage = module["covered_lines"] if module is not None else 0
+    return [test["name"], test["duration"], coverage]
+
+def write_ratio(records, output_file):
+    """Saves the ratio records as a list of tests."""
+    write_test_metrics(records, output_file)
     print(f"Coverage metrics successfully computed and saved to {output_file}")
-    
-    return test_metrics
+
+def write_nsga(rows, output_file):
+    """Saves the NSGA rows under the "data" key."""
+    with open(output_file, 'w') as f:
+        json.dump({"data": rows}, f, indent=2)
+    print(f"NSGA format data successfully saved to {output_file}")
+
+# Output formats: how to build one entry per test and how to save the entries
+FORMATS = {
+    "ratio": (ratio_record, write_ratio),
+    "nsga": (nsga_row, write_nsga),
+}
+
+@timed("mapping")
+def map_tests(coverage_file, test_metrics_file, outputs):
+    """
+    Joins test metrics to module coverage in a single pass and writes every requested format.
+
+    Args:
+        coverage_file: Path to coverage.json file
+        test_metrics_file: Path to test_metrics.json file
+        outputs: Mapping from a format name in FORMATS to its output path
+    """
+    module_coverage = load_module_coverage(coverage_file)
+
+    # The module name only depends on the test file, so derive it once per file
+    modules_by_file = {}
+    results = {name: [] for name in outputs}
+
+    # Build the NSGA row before the ratio format overwrites the coverage field
+    builders = [(name, FORMATS[name][0]) for name in sorted(outputs, key=lambda name: name == "ratio")]
+
+    # Process each test metric as it is read
+    for test in iter_test_metrics(test_metrics_file):
+        test_file = test["name"].split("::")[0]
+        if test_file not in modules_by_file:
+            module_name = os.path.basename(test_file).replace("test_", "").replace(".py", "")
+            modules_by_file[test_file] = module_coverage.get(module_name)
+        module = modules_by_file[test_file]
+
+        for name, build in builders:
+            results[name].append(build(test, module))
+
+    # Save every requested format
+    for name, output_file in outputs.items():
+        FORMATS[name][1](results[name], output_file)
+
+    return results
+
+def map_coverage_percent_to_tests(coverage_file, test_metrics_file, output_file):
+    """
+    Maps coverage data from coverage.json to test_metrics.json.
+    Each test gets the covered_lines/duration ratio from its corresponding module.
+
+    Args:
+        coverage_file: Path to coverage.json file
+        test_metrics_file: Path to test_metrics.json file
+        output_file: Path to save the computed test metrics
+    """
+    return map_tests(coverage_file, test_metrics_file, {"ratio": output_file})["ratio"]
 
 def create_nsga_format(coverage_file, test_metrics_file, output_file):
     """
     Creates a JSON file in NSGA format with test case name, duration, and coverage.
-    
+
     Args:
         coverage_file: Path to coverage.json file
         test_metrics_file: Path to test_metrics.json file
         output_file: Path to save the NSGA format data
     """
-    # Load the coverage and test metrics files
-    with open(coverage_file, 'r') as f:
-        coverage_data = json.load(f)
-    
-    with open(test_metrics_file, 'r') as f:
-        test_metrics = json.load(f)
-    
-    # Create mapping from module names to their coverage data
-    module_coverage = {}
-    for file_path, data in coverage_data["files"].items():
-        if file_path.startswith("chasten/"):
-            module_name = os.path.basename(file_path).replace(".py", "")
-            module_coverage[module_name] = {
-                "covered_lines": data["summary"]["covered_lines"]
-            }
-    
-    # Create NSGA format data
-    nsga_data = {"data": []}
-    
-    # Process each test metric
-    for test in test_metrics:
-        test_file = test["name"].split("::")[0]
-        module_name = os.path.basename(test_file).replace("test_", "").replace(".py", "")
-        
-        # Get the coverage (lines) for this module
-        coverage = 0
-        if module_name in module_coverage:
-            coverage = module_coverage[module_name]["covered_lines"]
-        
-        # Add the test data in NSGA format
-        nsga_data["data"].append([
-            test["name"],
-            test["duration"],
-            coverage
-        ])
-    
-    # Save the NSGA format data
-    with open(output_file, 'w') as f:
-        json.dump(nsga_data, f, indent=2)
-    
-    print(f"NSGA format data successfully saved to {output_file}")
-    
-    return nsga_data
+    return {"data": map_tests(coverage_file, test_metrics_file, {"nsga": output_file})["nsga"]}
+
+def main(argv=None):
+    """Parses the command line and writes the requested formats in one pass."""
+    parser = argparse.ArgumentParser(description="Map module coverage onto test metrics.")
+    parser.add_argument("--coverage", default="coverage.json", help="path to coverage.json")
+    parser.add_argument("--metrics", default="test_metrics.json", help="path to test_metrics.json")
+    parser.add_argument("--ratio-output", default="newtryingToCompute.json", help="where to save the ratio format")
+    parser.add_argument("--nsga-output", default="nsga.json", help="where to save the NSGA format")
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        choices=sorted(FORMATS),
+        default=["ratio", "nsga"],
+        help="formats to produce",
+    )
+    args = parser.parse_args(argv)
+
+    paths = {"ratio": args.ratio_output, "nsga": args.nsga_output}
+    map_tests(args.coverage, args.metrics, {name: paths[name] for name in args.formats})
 
 if __name__ == "__main__":
-    map_coverage_percent_to_tests("coverage.json", "test_metrics.json", "newtryingToCompute.json")
-    create_nsga_format("coverage.json", "test_metrics.json", "nsga.json")
\ No newline at end of file
+    main()
@@ -0,0 +1,52 @@
+"""Derived per-test metrics defined once, computed over whole columns and memoized per dataset version."""
+
+import functools
+from pathlib import Path
+from typing import Callable, Dict, Union
+
+import numpy as np
+
+from metrics_cache import dataset_version, load_columns
+
+# Number of (dataset version, fitness) results kept before the least recently used is dropped
+CACHE_SIZE = 32
+
+
+def coverage_per_second(duration: float, coverage: float) -> float:
+    """Return the lines covered per second of a test, higher is better, and 0 without a duration."""
+    return coverage / duration if duration > 0 else 0.0
+
+
+def coverage_per_second_column(duration: np.ndarray, coverage: np.ndarray) -> np.ndarray:
+    """Vectorized coverage_per_second over whole columns."""
+    duration = np.asarray(duration, dtype=np.float64)
+    ratio = np.zeros(len(duration))
+    np.divide(np.asarray(coverage, dtype=np.float64), duration, out=ratio, where=duration > 0)
+    return ratio
+
+
+# Fitness name -> function of the metric columns, every one of them higher is better
+FITNESS: Dict[str, Callable[[Dict[str, np.ndarray]], np.ndarray]] = {
+    "coverage_per_second": lambda columns: coverage_per_second_column(columns["duration"], columns["coverage"]),
+    "coverage": lambda columns: np.asarray(columns["coverage"], dtype=np.float64),
+}
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _fitness_column(source: str, version: str, name: str) -> np.ndarray:
+    """Compute one fitness for one version of a dataset; the version is only part of the cache key."""
+    values = FITNESS[name](load_columns(source))
+    values.setflags(write=False)  # the same array is handed to every caller
+    return values
+
+
+def fitness_column(source: Union[str, Path], name: str = "coverage_per_second") -> np.ndarray:
+    """Return a fitness for every test of a metrics file, reusing it until the file changes."""
+    if name not in FITNESS:
+        raise ValueError(f"Unknown fitness '{name}'")
+    return _fitness_column(str(Path(source).resolve()), dataset_version(source), name)
+
+
+def clear_cache() -> None:
+    """Forget every memoized fitness column."""
+    _fitness_column.cache_clear()
@@ -0,0 +1,190 @@
+"""Compact containers for test metrics: a slotted record and a structured-array collection."""
+
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+
+from metrics_cache import OUTCOMES, iter_rows, load_columns, outcome_code
+from metrics_io import iter_test_metrics, write_test_metrics
+from sort_keys import SortSpec, metric_value, parse_sort_spec
+
+# Fields of every record, in the order of the structured dtype
+FIELDS = ("name", "duration", "outcome", "coverage")
+
+# Alphabetical rank of each outcome code, so outcome columns sort like the outcome strings
+OUTCOME_RANKS = np.argsort(np.argsort(OUTCOMES))
+
+
+class MetricRecord:
+    """One test's metrics, with attribute access and the dict lookups the sorting modules use."""
+
+    __slots__ = FIELDS
+
+    def __init__(self, name: str, duration: float, outcome: Optional[str], coverage: Any) -> None:
+        self.name = name
+        self.duration = duration
+        self.outcome = outcome
+        self.coverage = coverage  # a number, or the nested dict of enhanced_test_metrics.json
+
+    @classmethod
+    def from_dict(cls, test: Dict[str, Any]) -> "MetricRecord":
+        """Build a record from a test dictionary."""
+        return cls(test["name"], test["duration"], test.get("outcome"), test["coverage"])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the test dictionary written to the metrics files."""
+        return {"name": self.name, "duration": self.duration, "outcome": self.outcome, "coverage": self.coverage}
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Look up a field like dict.get."""
+        return getattr(self, key) if key in FIELDS else default
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, MetricRecord):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in FIELDS)
+
+    def __repr__(self) -> str:
+        return f"MetricRecord(name={self.name!r}, duration={self.duration!r}, outcome={self.outcome!r}, coverage={self.coverage!r})"
+
+
+def load_records(file_path: Union[str, Path]) -> List[MetricRecord]:
+    """Read a JSON or JSON Lines metrics file into records, keeping nested coverage."""
+    return [MetricRecord.from_dict(test) for test in iter_test_metrics(file_path)]
+
+
+def record_dtype(name_length: int) -> np.dtype:
+    """Return the structured dtype for names of up to name_length characters."""
+    return np.dtype([
+        ("name", f"U{max(name_length, 1)}"),
+        ("duration", np.float64),
+        ("outcome", np.int8),  # a code into OUTCOMES
+        ("coverage", np.float64),  # nested coverage is summed, as everywhere else
+    ])
+
+
+class MetricArray:
+    """Test metrics stored in one NumPy structured array, about 20 bytes plus the name per test."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: np.ndarray) -> None:
+        self.data = data
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray]) -> "MetricArray":
+        """Pack separate columns, such as the ones load_columns returns, into one array."""
+        names = np.asarray(columns["name"]).astype(str)
+        data = np.empty(len(names), dtype=record_dtype(names.dtype.itemsize // 4))
+        data["name"] = names
+        data["duration"] = columns["duration"]
+        data["outcome"] = columns["outcome"] if "outcome" in columns else 0
+        data["coverage"] = columns["coverage"]
+        return cls(data)
+
+    @classmethod
+    def from_records(cls, tests: Iterable[Any]) -> "MetricArray":
+        """Pack records or test dictionaries into one array."""
+        tests = list(tests)
+        return cls.from_columns({
+            "name": np.array([test["name"] for test in tests], dtype=str),
+            "duration": np.array([test["duration"] for test in tests], dtype=np.float64),
+            "outcome": np.array([outcome_code(test.get("outcome")) for test in tests], dtype=np.int8),
+            "coverage": np.array([metric_value(test["coverage"]) for test in tests], dtype=np.float64),
+        })
+
+    @classmethod
+    def load(cls, source: Union[str, Path], cached: bool = True) -> "MetricArray":
+        """Read any of the metrics formats, through the column cache unless cached is False."""
+        if cached:
+            return cls.from_columns(load_columns(source))
+        rows = list(iter_rows(source))
+        return cls.from_columns({
+            "name": np.array([row[0] for row in rows], dtype=str),
+            "duration": np.array([row[1] for row in rows], dtype=np.float64),
+            "coverage": np.array([row[2] for row in rows], dtype=np.float64),
+            "outcome": np.array([outcome_code(row[3]) for row in rows], dtype=np.int8),
+        })
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, key: Any) -> Any:
+        """Return a column for a field name, a record for a position and a MetricArray otherwise."""
+        if isinstance(key, str):
+            return self.data[key]
+        if isinstance(key, (int, np.integer)):
+            return self._record(self.data[key])
+        return MetricArray(self.data[key])
+
+    def __iter__(self) -> Iterator[MetricRecord]:
+        for row in self.data:
+            yield self._record(row)
+
+    @staticmethod
+    def _record(row: np.void) -> MetricRecord:
+        return MetricRecord(str(row["name"]), float(row["duration"]), OUTCOMES[row["outcome"]], float(row["coverage"]))
+
+    def to_records(self) -> List[MetricRecord]:
+        """Unpack every row into a record."""
+        names = self.data["name"].tolist()
+        outcomes = [OUTCOMES[code] for code in self.data["outcome"].tolist()]
+        return [
+            MetricRecord(name, duration, outcome, coverage)
+            for name, duration, outcome, coverage in zip(
+                names, self.data["duration"].tolist(), outcomes, self.data["coverage"].tolist()
+            )
+        ]
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Unpack every row into the test dictionaries of the metrics files."""
+        return [record.to_dict() for record in self.to_records()]
+
+    def save(self, output_file: Union[str, Path], nsga: bool = False) -> None:
+        """Write the tests as a JSON array, as JSON Lines for .jsonl paths, or in the NSGA format."""
+        if not nsga:
+            write_test_metrics(self.to_dicts(), output_file)
+            return
+        rows = [list(row) for row in zip(self.data["name"].tolist(), self.data["duration"].tolist(), self.data["coverage"].tolist())]
+        with open(output_file, "w") as f:
+            json.dump({"data": rows}, f, indent=2)
+
+    def argsort(self, spec: SortSpec, workers: Optional[int] = 1) -> np.ndarray:
+        """Return the positions that stably sort the tests by one or more fields."""
+        from parallel_sort import key_column, parallel_argsort
+
+        keys = []
+        for parts, descending in parse_sort_spec(spec):
+            if len(parts) != 1 or parts[0] not in FIELDS:
+                raise KeyError(".".join(parts))
+            column = self.data[parts[0]]
+            if parts[0] == "outcome":
+                column = OUTCOME_RANKS[column]  # outcomes sort by their names, not their codes
+            column = key_column(column)
+            keys.append(-column if descending else column)
+        return parallel_argsort(keys, workers)
+
+    def sort(self, spec: SortSpec, workers: Optional[int] = 1) -> "MetricArray":
+        """Return a copy of the tests stably sorted by one or more fields."""
+        return MetricArray(self.data[self.argsort(spec, workers)])
+
+    def top_k(
+        self,
+        key: str,
+        k: int = 1,
+        largest: bool = True,
+        outcome: Optional[str] = None,
+        keep_ties: bool = False,
+    ) -> "MetricArray":
+        """Return the k best tests by a numeric field, best first."""
+        from selection import top_k_indices
+
+        mask = None if outcome is None else self.data["outcome"] == outcome_code(outcome)
+        return MetricArray(self.data[top_k_indices(self.data[key], k, largest, mask, keep_ties)])
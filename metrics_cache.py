@@ -0,0 +1,187 @@
+"""Cache test metrics as memory-mapped NumPy columns next to their JSON source."""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Union
+
+import numpy as np
+
+from metrics_io import file_digest, iter_test_metrics
+from profile import timed
+from sort_keys import metric_value
+
+# Columns stored for every metrics file, one .npy file each
+COLUMNS = ("name", "duration", "coverage", "outcome")
+
+# Outcome codes, the position in this tuple is the stored code
+OUTCOMES = ("unknown", "passed", "failed", "skipped", "error", "xfailed", "xpassed")
+
+# Bump when the layout of the cache changes so old caches are rebuilt
+CACHE_VERSION = 2
+
+# Age after which a column build that meta.json no longer points at is removed
+STALE_BUILD_SECONDS = 60
+
+# Times a reader looks up the current build before giving up
+LOAD_ATTEMPTS = 5
+
+
+def cache_dir(source: Union[str, Path]) -> Path:
+    """Return the cache directory that sits next to a metrics file, holding meta.json and the column builds."""
+    source = Path(source)
+    return source.with_name(source.name + ".cache")
+
+
+def outcome_code(outcome: Any) -> int:
+    """Map an outcome string to its stored code."""
+    try:
+        return OUTCOMES.index(outcome)
+    except ValueError:
+        return 0
+
+
+def is_nsga_format(source: Union[str, Path]) -> bool:
+    """Tell whether a metrics file is in the NSGA format, whose coverage is the covered line count."""
+    if str(source).endswith(".jsonl"):
+        return False
+    with open(source, "r") as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+    return first == "{"
+
+
+def iter_rows(source: Union[str, Path]) -> Iterable[List[Any]]:
+    """Yield [name, duration, coverage, outcome] rows from any of the metrics formats."""
+    if is_nsga_format(source):
+        # the NSGA format: {"data": [[name, duration, coverage], ...]}
+        with open(source, "r") as f:
+            for name, duration, coverage in json.load(f)["data"]:
+                yield [name, duration, coverage, "unknown"]
+        return
+    for test in iter_test_metrics(source):
+        yield [test["name"], test["duration"], metric_value(test["coverage"]), test.get("outcome")]
+
+
+@timed("parse")
+def build_columns(source: Union[str, Path]) -> Dict[str, np.ndarray]:
+    """Parse a metrics file into columnar arrays."""
+    names: List[str] = []
+    duration: List[float] = []
+    coverage: List[float] = []
+    outcome: List[int] = []
+    for name, test_duration, test_coverage, test_outcome in iter_rows(source):
+        names.append(name)
+        duration.append(test_duration)
+        coverage.append(test_coverage)
+        outcome.append(outcome_code(test_outcome))
+    return {
+        "name": np.array(names, dtype=str),
+        "duration": np.array(duration, dtype=np.float64),
+        "coverage": np.array(coverage, dtype=np.float64),
+        "outcome": np.array(outcome, dtype=np.int8),
+    }
+
+
+def _read_meta(directory: Path) -> Dict[str, Any]:
+    """Read the cache metadata, or return an empty dict when it is missing or broken."""
+    try:
+        with open(directory / "meta.json", "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(directory: Path, meta: Dict[str, Any]) -> None:
+    """Replace the cache metadata atomically."""
+    # a private temporary file, so concurrent writers never share one
+    handle, temporary = tempfile.mkstemp(prefix="meta.", suffix=".tmp", dir=directory)
+    with os.fdopen(handle, "w") as f:
+        json.dump(meta, f)
+    os.replace(temporary, directory / "meta.json")
+
+
+def _columns_dir(directory: Path, meta: Dict[str, Any]) -> Path:
+    """Return the build of the columns that the metadata points at."""
+    return directory / meta.get("columns", "")
+
+
+def is_fresh(source: Union[str, Path]) -> bool:
+    """Check whether the cache still matches its source, by mtime and size first and by hash second."""
+    directory = cache_dir(source)
+    meta = _read_meta(directory)
+    if meta.get("version") != CACHE_VERSION or "columns" not in meta:
+        return False
+    if not all((_columns_dir(directory, meta) / f"{column}.npy").exists() for column in COLUMNS):
+        return False
+    stat = os.stat(source)
+    if meta.get("mtime_ns") == stat.st_mtime_ns and meta.get("size") == stat.st_size:
+        return True
+    # the file was touched, only rebuild when its contents really changed
+    if meta.get("sha256") != file_digest(source):
+        return False
+    meta.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    _write_meta(directory, meta)
+    return True
+
+
+def write_cache(source: Union[str, Path], columns: Dict[str, np.ndarray]) -> Path:
+    """Save the columns next to the source and record what they were built from."""
+    directory = cache_dir(source)
+    stat = os.stat(source)
+    meta = {
+        "version": CACHE_VERSION,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": file_digest(source),
+        "rows": int(len(columns["name"])),
+    }
+    # every build gets its own directory and meta.json is replaced atomically to point at it,
+    # so a reader always finds either the previous build or the new one, never a gap
+    directory.mkdir(exist_ok=True)
+    build = Path(tempfile.mkdtemp(prefix="columns.", dir=directory))
+    for column in COLUMNS:
+        np.save(build / f"{column}.npy", columns[column])
+    old = _read_meta(directory)
+    _write_meta(directory, {**meta, "columns": build.name})
+
+    if old.get("version") != CACHE_VERSION:
+        for column in COLUMNS:
+            (directory / f"{column}.npy").unlink(missing_ok=True)  # the unversioned layout
+    # the build just replaced stays for readers that read the old meta.json a moment ago; other
+    # builds go once they are old enough not to be another writer's build that is not pointed at yet
+    keep = {build.name, old.get("columns")}
+    for other in directory.glob("columns.*"):
+        try:
+            if other.name not in keep and time.time() - other.stat().st_mtime > STALE_BUILD_SECONDS:
+                shutil.rmtree(other)
+        except FileNotFoundError:
+            pass  # another writer removed it first
+    return directory
+
+
+def dataset_version(source: Union[str, Path]) -> str:
+    """Return the content hash of a metrics file, refreshing its cache first when it is stale."""
+    if not is_fresh(source):
+        write_cache(source, build_columns(source))
+    return _read_meta(cache_dir(source))["sha256"]
+
+
+@timed("load")
+def load_columns(source: Union[str, Path], rebuild: bool = False) -> Dict[str, np.ndarray]:
+    """Return the metric columns of a file, memory-mapped from the cache when it is fresh."""
+    if rebuild or not is_fresh(source):
+        write_cache(source, build_columns(source))
+    directory = cache_dir(source)
+    # a concurrent writer can remove the build meta.json pointed at a moment ago, so look again
+    for attempt in range(LOAD_ATTEMPTS):
+        build = _columns_dir(directory, _read_meta(directory))
+        try:
+            return {column: np.load(build / f"{column}.npy", mmap_mode="r") for column in COLUMNS}
+        except FileNotFoundError:
+            if attempt == LOAD_ATTEMPTS - 1:
+                raise
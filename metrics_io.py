@@ -0,0 +1,105 @@
+"""Stream test-metric records out of JSON and JSON Lines files."""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, TextIO, Union
+
+# Size of each read from the metrics file, in characters
+CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]"
+
+
+def file_digest(path: Union[str, Path]) -> str:
+    """Hash a file's contents in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_json_array(file: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array one at a time."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+
+    def fill() -> bool:
+        """Drop the consumed prefix and read the next chunk, returning False at the end."""
+        nonlocal buffer, position, eof
+        chunk = file.read(chunk_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        eof = not chunk
+        return not eof
+
+    def next_token() -> str:
+        """Skip whitespace and return the next character, or '' at the end of the file."""
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not fill():
+                return ""
+
+    if next_token() != "[":
+        raise json.JSONDecodeError("Expecting '['", buffer, position)
+    position += 1
+    if next_token() == "]":
+        return
+
+    while True:
+        # decode one element, reading more whenever it runs past the buffer
+        while True:
+            next_token()
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if fill():
+                    continue
+                raise
+            if (end == len(buffer) or buffer[end] not in _DELIMITERS) and not eof and fill():
+                continue  # a number may continue in the next chunk
+            break
+        position = end
+        yield value
+
+        separator = next_token()
+        if separator == "]":
+            return
+        if separator != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", buffer, position)
+        position += 1
+
+
+def iter_json_lines(file: TextIO) -> Iterator[Any]:
+    """Yield one record per non-empty line of a JSON Lines file."""
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_test_metrics(file_path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+    """Yield test records from a JSON array file or a .jsonl file without loading it whole."""
+    with open(file_path, "r") as f:
+        if str(file_path).endswith(".jsonl"):
+            yield from iter_json_lines(f)
+        else:
+            yield from iter_json_array(f)
+
+
+def write_test_metrics(metrics: Iterable[Dict[str, Any]], output_file: Union[str, Path]) -> None:
+    """Write test records as JSON Lines for .jsonl paths and as an indented JSON array otherwise."""
+    with open(output_file, "w") as f:
+        if str(output_file).endswith(".jsonl"):
+            for test in metrics:
+                f.write(json.dumps(test))
+                f.write("\n")
+        else:
+            json.dump(list(metrics), f, indent=2)
@@ -1,10 +1,22 @@
 """Run an NSGA-II Algorithm using a binary tournament method."""
 
-import json
+from bisect import bisect_right
+from typing import Iterable, Iterator, List, Optional, Tuple
+
 import numpy as np
-from pymoo.operators.selection.tournament import TournamentSelection
-from pymoo.core.population import Population
-from pymoo.core.individual import Individual
+
+from fitness import coverage_per_second_column, fitness_column
+from metric_records import MetricArray
+from profile import output_performance_data, timed
+
+# largest number of tournament pairs that is materialized at once
+MAX_PAIRS = 5_000_000
+
+# round number that stands for never, so a replay does not need to know its length up front
+NEVER = np.iinfo(np.int64).max
+
+# masked passes over the chained removals before they are replayed one round at a time
+FIXED_POINT_PASSES = 8
 
 # P is the permutations of things to be compared between competitors
 def binary_tournament(pop, P, **kwargs):
@@ -26,8 +38,8 @@ def binary_tournament(pop, P, **kwargs):
     for i in range(n_tournaments):
         a, b = P[i]
 
-        # if the first individual is better, choose it
-        if pop[a].F < pop[b].F:
+        # if the first individual has the higher fitness, choose it
+        if pop[a].F > pop[b].F:
             S[i] = a
             loser = pop[b].name
             winner = pop[a].name
@@ -50,44 +62,282 @@ def binary_tournament(pop, P, **kwargs):
     print(f"\nThe Ideal Tests Are: {winner_list}\n")
     return S
 
-def main():
-    """Performs an experiment for a multi objective sorting algorithm."""
-    with open('data/nsga.json', 'r') as json_data:
-        data = json.load(json_data)
-    data_array = np.array(data["data"])
+
+def decide_tournaments(fitness: np.ndarray, P: np.ndarray) -> np.ndarray:
+    """Decide every binary tournament at once and return the winning indices."""
+    # compare both competitor columns in one pass, the first wins only with a strictly higher fitness
+    first, second = P[:, 0], P[:, 1]
+    return np.where(fitness[first] > fitness[second], first, second)
+
+
+class TournamentReplay:
+    """The winner/loser bookkeeping of binary_tournament, replayed one chunk of tournaments at a time."""
+
+    def __init__(self, names: np.ndarray) -> None:
+        # tests with the same name share one record, just like the name lists did
+        self.names, self.codes = np.unique(np.asarray(names).astype(str), return_inverse=True)
+        self.rounds = 0  # tournaments replayed so far
+        # the first tournament each test won and lost, and the one that dropped it from the winner list
+        self.first_win = np.full(len(self.names), NEVER, dtype=np.int64)
+        self.first_loss = np.full(len(self.names), NEVER, dtype=np.int64)
+        self.removed_at = np.full(len(self.names), NEVER, dtype=np.int64)
+
+    def play(self, fitness: np.ndarray, P: np.ndarray) -> np.ndarray:
+        """Decide the next chunk of tournaments, replay its bookkeeping and return the winning indices."""
+        S = decide_tournaments(fitness, P)
+        losers = np.where(S == P[:, 0], P[:, 1], P[:, 0])
+        self.update(self.codes[S], self.codes[losers])
+        return S
+
+    def update(self, winners: np.ndarray, losers: np.ndarray) -> None:
+        """Replay the next chunk of decided tournaments, given as winner and loser codes."""
+        rounds = np.arange(self.rounds, self.rounds + len(winners), dtype=np.int64)
+        self.rounds += len(winners)
+        np.minimum.at(self.first_win, winners, rounds)
+        np.minimum.at(self.first_loss, losers, rounds)
+
+        # a test joins the winner list if it won no later than it first lost (a test that meets
+        # itself does both at once); for a winner that has already lost, both rounds are settled here
+        earlier_loss = self.first_loss[winners] < rounds
+        joined = self.first_win[winners] <= self.first_loss[winners]
+
+        # a loser is dropped from the winner list when it loses to an earlier loser that is
+        # not on the list; winners that never joined are off it for good, so those drops are known at once
+        fixed = earlier_loss & ~joined
+        np.minimum.at(self.removed_at, losers[fixed], rounds[fixed])
+
+        # the other drops depend on whether their winner was dropped before them
+        chained = np.flatnonzero(earlier_loss & joined)
+        self.removed_at = resolve_removals(self.removed_at, rounds[chained], winners[chained], losers[chained])
+
+    def ideal(self) -> List[str]:
+        """Return the names left on the winner list, in the order they first won."""
+        joined = (self.first_win < NEVER) & (self.first_win <= self.first_loss)
+        ideal = np.flatnonzero(joined & (self.removed_at == NEVER))
+        return self.names[ideal[np.argsort(self.first_win[ideal], kind="stable")]].tolist()
+
+
+def resolve_removals(removed_at: np.ndarray, rounds: np.ndarray, winners: np.ndarray, losers: np.ndarray) -> np.ndarray:
+    """Apply the drops that only happen if their winner was dropped in an earlier round."""
+    # every masked pass settles one more link of a removal chain; ordinary data settles in a few,
+    # a longer chain is replayed in round order instead, so the cost stays linear in the tournaments
+    current = removed_at
+    for _ in range(FIXED_POINT_PASSES):
+        drops = current[winners] < rounds
+        updated = removed_at.copy()
+        np.minimum.at(updated, losers[drops], rounds[drops])
+        if np.array_equal(updated, current):
+            return current
+        current = updated
+
+    removed = removed_at.tolist()
+    for round_, winner, loser in zip(rounds.tolist(), winners.tolist(), losers.tolist()):
+        if removed[winner] < round_ < removed[loser]:
+            removed[loser] = round_
+    return np.array(removed, dtype=np.int64)
+
+
+def run_tournaments(fitness: np.ndarray, names: np.ndarray, P: np.ndarray) -> Tuple[np.ndarray, List[str]]:
+    """Decide all binary tournaments on plain arrays and return S with the ideal test names."""
+    replay = TournamentReplay(names)
+    S = replay.play(fitness, P)
+    return S, replay.ideal()
+
+
+def stream_tournaments(fitness: np.ndarray, names: np.ndarray, chunks: Iterable[np.ndarray]) -> List[str]:
+    """Play chunks of tournaments in order and return the ideal test names, without keeping S."""
+    replay = TournamentReplay(names)
+    for P in chunks:
+        replay.play(fitness, P)
+    return replay.ideal()
+
+
+@timed("tournament")
+def binary_tournament_batched(pop, P, **kwargs):
+    """Run all binary tournaments as array operations to determine the best fit individual(s)."""
+    # The P input defines the tournaments and competitors
+    n_tournaments, n_competitors = P.shape
+
+    if n_competitors != 2:
+        raise Exception("Only pressure=2 allowed for binary tournament!")
+
+    # pull the fitness values into one contiguous float array
+    fitness = np.ascontiguousarray(pop.get("F"), dtype=float).reshape(len(pop))
+    S, winner_list = run_tournaments(fitness, pop.get("name"), P)
+
+    # return the names of the ideal tests
+    print(f"\nThe Ideal Tests Are: {winner_list}\n")
+    return S
+
+def pair_count(n: int) -> int:
+    """Return the number of distinct pairs among n competitors."""
+    return n * (n - 1) // 2
+
+
+def all_pairs(n: int) -> np.ndarray:
+    """Build every pair (i, j) with i < j in row-major order."""
+    first, second = np.triu_indices(n, k=1)
+    return np.column_stack((first, second))
+
+
+def pair_chunks(n: int, chunk_size: int = 100_000) -> Iterator[np.ndarray]:
+    """Stream every pair (i, j) with i < j in row-major order as arrays of at most chunk_size rows."""
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    # position of the first pair of every row in the row-major order
+    rows = np.arange(max(n - 1, 0), dtype=np.int64)
+    row_starts = rows * (2 * n - rows - 1) // 2
+    for start in range(0, pair_count(n), chunk_size):
+        positions = np.arange(start, min(start + chunk_size, pair_count(n)), dtype=np.int64)
+        first = np.searchsorted(row_starts, positions, side="right") - 1
+        yield np.column_stack((first, positions - row_starts[first] + first + 1))
+
+
+def sampled_pairs(n: int, n_pairs: int, seed: Optional[int] = None) -> np.ndarray:
+    """Draw n_pairs random tournaments between two distinct competitors."""
+    if n < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    first = rng.integers(0, n, size=n_pairs)
+    # shift by a non-zero offset so nobody competes against themselves
+    second = (first + rng.integers(1, n, size=n_pairs)) % n
+    return np.column_stack((first, second))
+
+
+def tournament_pairs(n: int, max_pairs: int = MAX_PAIRS, seed: Optional[int] = None) -> np.ndarray:
+    """Return every pair when it fits in max_pairs, otherwise a random sample of that size."""
+    if pair_count(n) <= max_pairs:
+        return all_pairs(n)
+    return sampled_pairs(n, max_pairs, seed)
+
+
+def non_dominated_sort(duration: np.ndarray, coverage: np.ndarray) -> np.ndarray:
+    """Assign every test its Pareto front (0 is best) for minimum duration and maximum coverage."""
+    n = len(duration)
+    front = np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return front
+
+    # sweep the tests by duration, breaking ties with the higher coverage first,
+    # so a test can only be dominated by tests that were already placed
+    loss = -np.asarray(coverage, dtype=float)
+    order = np.lexsort((loss, duration))
+    sweep_duration = duration[order].tolist()
+    sweep_loss = loss[order].tolist()
+
+    # best_loss[k] is the lowest coverage loss seen in front k; it increases with k,
+    # so the first front that does not dominate a test is found by binary search
+    best_loss: List[float] = []
+    previous = None
+    for position, (test_duration, test_loss) in enumerate(zip(sweep_duration, sweep_loss)):
+        if previous == (test_duration, test_loss):
+            # identical objectives never dominate each other, keep them together
+            k = front[order[position - 1]]
+        else:
+            k = bisect_right(best_loss, test_loss)
+            if k == len(best_loss):
+                best_loss.append(test_loss)
+            else:
+                best_loss[k] = test_loss
+        front[order[position]] = k
+        previous = (test_duration, test_loss)
+    return front
+
+
+def crowding_distance(objectives: np.ndarray, front: np.ndarray) -> np.ndarray:
+    """Compute the crowding distance of every test within its own front."""
+    n, n_objectives = objectives.shape
+    distance = np.zeros(n, dtype=float)
+    if n == 0:
+        return distance
+
+    for m in range(n_objectives):
+        values = objectives[:, m]
+        # group the tests by front and sort each front by this objective
+        order = np.lexsort((values, front))
+        sorted_values = values[order]
+        sorted_front = front[order]
+
+        # the first and last test of every front are boundary points
+        starts = np.r_[True, sorted_front[1:] != sorted_front[:-1]]
+        ends = np.r_[sorted_front[1:] != sorted_front[:-1], True]
+
+        # normalize by the spread of the objective inside each front
+        first_value = sorted_values[np.maximum.accumulate(np.where(starts, np.arange(n), 0))]
+        last_index = np.flatnonzero(ends)
+        last_value = sorted_values[last_index[np.cumsum(starts) - 1]]
+        spread = last_value - first_value
+
+        # interior tests get the gap between their neighbours
+        gap = np.zeros(n, dtype=float)
+        interior = ~(starts | ends)
+        gap[interior] = sorted_values[2:][interior[1:-1]] - sorted_values[:-2][interior[1:-1]]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gap = np.where(spread > 0, gap / spread, 0.0)
+        gap[starts | ends] = np.inf
+        distance[order] += gap
+    return distance
+
+
+@timed("rank")
+def rank_tests(names: np.ndarray, duration: np.ndarray, coverage: np.ndarray) -> List[List[str]]:
+    """Rank tests into Pareto fronts, each ordered by descending crowding distance."""
+    front = non_dominated_sort(duration, coverage)
+    objectives = np.column_stack((duration, -np.asarray(coverage, dtype=float)))
+    distance = crowding_distance(objectives, front)
+
+    # order by front first, then by how isolated each test is inside its front
+    order = np.lexsort((-distance, front))
+    fronts: List[List[str]] = [[] for _ in range(int(front.max()) + 1 if len(front) else 0)]
+    for index in order:
+        fronts[front[index]].append(str(names[index]))
+    return fronts
+
+
+def build_population(names: np.ndarray, duration: np.ndarray, coverage: np.ndarray, fitness: Optional[np.ndarray] = None):
+    """Wrap the tests in a pymoo population with coverage per second as their fitness."""
+    # pymoo is only imported by the paths that need its objects
+    from pymoo.core.population import Population
+    from pymoo.core.individual import Individual
+
+    if fitness is None:
+        fitness = coverage_per_second_column(duration, coverage)
 
     # Create an empty Individuals List
     individuals = []
 
-    # Populate the List with individuals using the 2D array
-    for row in data_array:
-        ind = Individual(X=[row[1], row[2]])  # Set decision variables (X)
-        ind.name = row[0]
+    # Populate the List with individuals using the columns and the precomputed fitness
+    for name, test_duration, test_coverage, test_fitness in zip(names, duration, coverage, fitness.tolist()):
+        ind = Individual(X=[test_duration, test_coverage])  # Set decision variables (X)
+        ind.name = name
+        ind.F = test_fitness
         individuals.append(ind)
 
-    # Set fitness values
-    for ind in individuals:
-        ind.F = float(ind.X[1]) / float(ind.X[0])  # Assign fitness values as the sum of X
+    return Population(individuals)
+
+
+def main():
+    """Performs an experiment for a multi objective sorting algorithm."""
+    # load the tests into one structured array, the JSON is only parsed when nsga.json changes
+    tests = MetricArray.load('data/nsga.json')
+    names, duration, coverage = tests["name"], tests["duration"], tests["coverage"]
 
-    # Create a population object with the individuals
-    pop = Population(individuals)
+    # rank the tests by the two objectives with non-dominated sorting
+    fronts = rank_tests(names, duration, coverage)
+    print(f"\nPareto Front Sizes: {[len(front) for front in fronts]}")
+    print(f"\nThe Pareto Optimal Tests Are: {fronts[0]}\n")
 
-    # Generation of Pairing Array
-    a = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32,
-        33, 34, 35, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46, 47, 48, 49, 50, 51, 52, 53, 54, 55, 56, 57, 58, 59, 60, 61, 62, 63,
-        64, 65, 66, 67, 68, 69, 70, 71, 72, 73, 74, 75, 76, 77, 78, 79, 80, 81, 82, 83, 84, 85, 86, 87, 88, 89, 90, 91]
-    res = []
+    # Create a population object with the individuals, sharing the memoized fitness column
+    pop = build_population(names, duration, coverage, fitness_column('data/nsga.json'))
 
-    for i in range(len(a)):
-        for j in range(i + 1, len(a)):
-            res.append([a[i], a[j]])
+    # Pairing Array sized from the loaded population, sampled once it gets too large
+    P = tournament_pairs(len(pop))
 
-    # Pairing Array
-    P = np.array(res)
+    # run the binary tournaments on exactly these pairs
+    binary_tournament_batched(pop, P)
 
-    # run the binary tournament selection
-    selection = TournamentSelection(func_comp=binary_tournament)
-    selected = selection.do(P, pop, n_select=1, n_parents=2)
+    # Print where the time went
+    output_performance_data(label="⏱")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+"""Sort test metrics across processes with a sample sort over shared-memory key arrays."""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from profile import timed, timer
+from sort_keys import Descending, SortSpec, compile_sort_keys
+
+# Inputs smaller than this are sorted in the calling process, a pool costs more than it saves
+PARALLEL_THRESHOLD = 200_000
+
+# Ranges per worker, so a worker that finishes early can pick up another range
+RANGES_PER_WORKER = 4
+
+# Sampled keys per range when choosing the splitters
+OVERSAMPLING = 64
+
+
+def key_column(values: Any) -> np.ndarray:
+    """Turn one level of ascending sort keys into a float64 column that orders the same way."""
+    if isinstance(values, np.ndarray) and values.dtype.kind in "biuf":
+        return values.astype(np.float64)
+    values = list(values)
+    descending = bool(values) and isinstance(values[0], Descending)
+    if descending:
+        values = [value.value for value in values]
+    try:
+        column = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        # strings and other non-numeric keys are replaced by their rank among the distinct values
+        _, ranks = np.unique(np.asarray(values), return_inverse=True)
+        column = ranks.astype(np.float64)
+    return -column if descending else column
+
+
+def _lexsort(keys: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """Order positions by every key level, primary first, and by position among equal keys."""
+    # np.lexsort sorts by its last key first, so the levels go in reversed
+    return positions[np.lexsort((positions,) + tuple(level[positions] for level in keys[::-1]))]
+
+
+def sample_splitters(primary: np.ndarray, n_ranges: int, seed: Optional[int] = 0) -> np.ndarray:
+    """Pick up to n_ranges - 1 distinct splitters from a sorted random sample of the primary keys."""
+    rng = np.random.default_rng(seed)
+    sample = np.sort(primary[rng.integers(0, len(primary), n_ranges * OVERSAMPLING)])
+    splitters = sample[np.arange(1, n_ranges) * len(sample) // n_ranges]
+    return np.unique(splitters)  # repeated splitters would only add empty ranges
+
+
+def partition_ranges(primary: np.ndarray, splitters: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Group the positions by the range of their primary key and return them with the range offsets."""
+    # equal keys always land in the same range, so the ranges can be sorted independently
+    ranges = np.searchsorted(splitters, primary, side="right").astype(np.uint16)
+    counts = np.bincount(ranges, minlength=len(splitters) + 1)
+    positions = np.argsort(ranges, kind="stable")  # a radix sort on the small range ids
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    return positions.astype(np.int64), offsets
+
+
+def _sort_range(keys_name: str, positions_name: str, shape: Tuple[int, int], start: int, end: int) -> None:
+    """Sort one range of the shared positions in place, reading the keys from shared memory."""
+    keys_memory = shared_memory.SharedMemory(name=keys_name)
+    positions_memory = shared_memory.SharedMemory(name=positions_name)
+    try:
+        keys = np.ndarray(shape, dtype=np.float64, buffer=keys_memory.buf)
+        positions = np.ndarray(shape[1], dtype=np.int64, buffer=positions_memory.buf)
+        positions[start:end] = _lexsort(keys, positions[start:end])
+        del keys, positions  # the buffers cannot be closed while arrays still use them
+    finally:
+        keys_memory.close()
+        positions_memory.close()
+
+
+@timed("parallel sort")
+def parallel_argsort(
+    keys: Sequence[np.ndarray],
+    workers: Optional[int] = None,
+    seed: Optional[int] = 0,
+) -> np.ndarray:
+    """Return the positions that stably sort the rows by the key columns, primary key first."""
+    keys = np.vstack([np.asarray(level, dtype=np.float64) for level in keys])
+    n = keys.shape[1]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or n < PARALLEL_THRESHOLD:
+        return _lexsort(keys, np.arange(n))
+
+    with timer("partition"):
+        splitters = sample_splitters(keys[0], workers * RANGES_PER_WORKER, seed)
+        positions, offsets = partition_ranges(keys[0], splitters)
+
+    keys_memory = shared_memory.SharedMemory(create=True, size=keys.nbytes)
+    positions_memory = shared_memory.SharedMemory(create=True, size=positions.nbytes)
+    try:
+        np.ndarray(keys.shape, dtype=np.float64, buffer=keys_memory.buf)[:] = keys
+        shared_positions = np.ndarray(n, dtype=np.int64, buffer=positions_memory.buf)
+        shared_positions[:] = positions
+        # the largest ranges go first so no worker is left with a big one at the end
+        ranges = sorted(zip(offsets[:-1].tolist(), offsets[1:].tolist()), key=lambda r: r[0] - r[1])
+        with timer("sort ranges"), ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_sort_range, keys_memory.name, positions_memory.name, keys.shape, start, end)
+                for start, end in ranges
+                if end - start > 1
+            ]
+            for future in futures:
+                future.result()
+        # the ranges are already in key order, so the shared positions are the whole answer
+        result = shared_positions.copy()
+        del shared_positions
+    finally:
+        keys_memory.close()
+        keys_memory.unlink()
+        positions_memory.close()
+        positions_memory.unlink()
+    return result
+
+
+def parallel_sort(
+    data: List[Dict[str, Any]],
+    attribute: SortSpec,
+    workers: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Stably sort dictionaries by one or more attributes, sorting key ranges in worker processes."""
+    if not data:
+        return []
+    keys = [key_column([accessor(item) for item in data]) for accessor in compile_sort_keys(attribute)]
+    return [data[position] for position in parallel_argsort(keys, workers).tolist()]
@@ -1,33 +1,309 @@
 """Timing context manager for profiling code."""
 
+import asyncio
 import contextlib
-from time import perf_counter
-from typing import Generator, List, Tuple
+import contextvars
+import csv
+import functools
+import json
+import os
+import random
+import threading
+import tracemalloc
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, Any, Callable, Dict, Generator, List, Optional, Tuple
 
-from rich.console import Console
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
-# list to store performance data
-performance_data: List[Tuple[str, float]] = []
+if TYPE_CHECKING:
+    from rich.console import Console
+
+# Number of durations kept per context for the percentile estimates
+RESERVOIR_SIZE = 1024
+
+# separator between the names of nested spans
+PATH_SEPARATOR = " > "
+
+# Number of source lines listed per span in memory mode
+TOP_LINES = 5
+
+# set PROFILE_MEMORY=1 to track allocations in every span
+TRACK_MEMORY = os.environ.get("PROFILE_MEMORY", "") not in ("", "0")
+
+# the spans that are open in the current thread or task, outermost first
+_open_spans: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar("open_spans", default=())
+
+# the memory-tracked spans that are open in the current thread or task, outermost first
+_open_memory: contextvars.ContextVar[Tuple["MemoryFrame", ...]] = contextvars.ContextVar("open_memory", default=())
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Return the peak resident set size of the process, if the platform reports it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    """Take an allocation snapshot without the profiler's own bookkeeping."""
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+
+
+class MemoryFrame:
+    """Allocation bookkeeping for one open memory-tracked span."""
+
+    __slots__ = ("start_bytes", "peak_bytes", "snapshot", "started_tracing")
+
+    def __init__(self, top_lines: int) -> None:
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        # remember the enclosing span's peak before this span resets it
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in _open_memory.get():
+            frame.peak_bytes = max(frame.peak_bytes, peak)
+        tracemalloc.reset_peak()
+        self.start_bytes = current
+        self.peak_bytes = current
+        self.snapshot = _snapshot() if top_lines else None
+
+    def finish(self, top_lines: int) -> Tuple[int, int, List[str]]:
+        """Stop tracking and return the peak bytes above the start, the net bytes and the top lines."""
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak_bytes = max(self.peak_bytes, peak)
+        for frame in _open_memory.get():
+            frame.peak_bytes = max(frame.peak_bytes, self.peak_bytes)
+        lines: List[str] = []
+        if self.snapshot is not None:
+            # the source lines that allocated the most while the span was open
+            for diff in _snapshot().compare_to(self.snapshot, "lineno")[:top_lines]:
+                frame = diff.traceback[0]
+                lines.append(f"{frame.filename}:{frame.lineno} {diff.size_diff / 1024:+.1f} KiB")
+        if self.started_tracing:
+            tracemalloc.stop()
+        return self.peak_bytes - self.start_bytes, current - self.start_bytes, lines
+
+
+class SpanStats:
+    """Aggregate statistics for every run of one span path."""
+
+    __slots__ = (
+        "path", "parent", "count", "total_ns", "min_ns", "max_ns", "child_ns", "reservoir",
+        "memory_count", "peak_bytes", "net_bytes", "rss_bytes", "top_lines",
+    )
+
+    def __init__(self, path: str, parent: Optional[str]) -> None:
+        self.path = path
+        self.parent = parent
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = 0
+        self.max_ns = 0
+        self.child_ns = 0
+        self.reservoir: List[int] = []
+        self.memory_count = 0
+        self.peak_bytes = 0
+        self.net_bytes = 0
+        self.rss_bytes: Optional[int] = None
+        self.top_lines: List[str] = []
+
+    def add_memory(self, peak_bytes: int, net_bytes: int, rss_bytes: Optional[int], top_lines: List[str]) -> None:
+        """Record the allocations of one memory-tracked run."""
+        self.memory_count += 1
+        self.peak_bytes = max(self.peak_bytes, peak_bytes)
+        self.net_bytes += net_bytes
+        self.rss_bytes = rss_bytes
+        self.top_lines = top_lines  # the most recent run's top allocators
+
+    def add(self, duration_ns: int, rng: random.Random, reservoir_size: int) -> None:
+        """Record one run, keeping a uniform sample of the durations."""
+        self.count += 1
+        self.total_ns += duration_ns
+        self.min_ns = duration_ns if self.count == 1 else min(self.min_ns, duration_ns)
+        self.max_ns = max(self.max_ns, duration_ns)
+        if len(self.reservoir) < reservoir_size:
+            self.reservoir.append(duration_ns)
+        else:
+            # reservoir sampling: every run is kept with the same probability
+            slot = rng.randrange(self.count)
+            if slot < reservoir_size:
+                self.reservoir[slot] = duration_ns
+
+    def percentile(self, q: float) -> float:
+        """Estimate a percentile of the durations in nanoseconds."""
+        if not self.reservoir:
+            return 0.0
+        ordered = sorted(self.reservoir)
+        return float(ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))])
+
+    def summary(self) -> Dict[str, Any]:
+        """Return the statistics in milliseconds."""
+        ms = 1e-6
+        return {
+            "context": self.path,
+            "parent": self.parent,
+            "count": self.count,
+            "total_ms": self.total_ns * ms,
+            "self_ms": (self.total_ns - self.child_ns) * ms,
+            "min_ms": self.min_ns * ms,
+            "mean_ms": self.total_ns / self.count * ms if self.count else 0.0,
+            "max_ms": self.max_ns * ms,
+            "p50_ms": self.percentile(50) * ms,
+            "p95_ms": self.percentile(95) * ms,
+            "p99_ms": self.percentile(99) * ms,
+            "peak_kib": self.peak_bytes / 1024 if self.memory_count else None,
+            "net_kib": self.net_bytes / self.memory_count / 1024 if self.memory_count else None,
+            "rss_peak_kib": self.rss_bytes / 1024 if self.rss_bytes is not None else None,
+            "top_lines": list(self.top_lines),
+        }
+
+
+class Profiler:
+    """Thread- and task-safe registry of nested timing spans."""
+
+    def __init__(
+        self,
+        reservoir_size: int = RESERVOIR_SIZE,
+        seed: Optional[int] = None,
+        track_memory: bool = TRACK_MEMORY,
+        top_lines: int = TOP_LINES,
+    ) -> None:
+        self.reservoir_size = reservoir_size
+        self.track_memory = track_memory
+        self.top_lines = top_lines
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, SpanStats] = {}
+
+    @contextlib.contextmanager
+    def span(self, context: str, memory: Optional[bool] = None) -> Generator[None, None, None]:
+        """Time a block of code, nested under whatever span is already open, and optionally track its memory."""
+        parents = _open_spans.get()
+        path = parents + (context,)
+        token = _open_spans.set(path)
+        frame = None
+        if self.track_memory if memory is None else memory:
+            frame = MemoryFrame(self.top_lines)
+            memory_token = _open_memory.set(_open_memory.get() + (frame,))
+        # start the timer
+        start_time = perf_counter_ns()
+        try:
+            # yield control back to the context manager's caller
+            yield
+        finally:
+            # stop the timer and record the block under its full path
+            duration = perf_counter_ns() - start_time
+            _open_spans.reset(token)
+            self._record(path, duration)
+            if frame is not None:
+                _open_memory.reset(memory_token)
+                peak_bytes, net_bytes, lines = frame.finish(self.top_lines)
+                with self._lock:
+                    self._stats[PATH_SEPARATOR.join(path)].add_memory(peak_bytes, net_bytes, peak_rss_bytes(), lines)
+
+    def _record(self, path: Tuple[str, ...], duration_ns: int) -> None:
+        """Add one duration to the statistics of a span and to its parent's child time."""
+        key = PATH_SEPARATOR.join(path)
+        parent = PATH_SEPARATOR.join(path[:-1]) or None
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = SpanStats(key, parent)
+            stats.add(duration_ns, self._rng, self.reservoir_size)
+            if parent is not None:
+                parent_stats = self._stats.get(parent)
+                if parent_stats is None:
+                    parent_stats = self._stats[parent] = SpanStats(parent, PATH_SEPARATOR.join(path[:-2]) or None)
+                parent_stats.child_ns += duration_ns
+
+    def timed(self, context: Optional[str] = None, memory: Optional[bool] = None) -> Callable[[Callable], Callable]:
+        """Decorate a function or coroutine function so every call is timed as a span."""
+
+        def decorate(func: Callable) -> Callable:
+            name = context or func.__qualname__
+            if asyncio.iscoroutinefunction(func):
+
+                @functools.wraps(func)
+                async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                    with self.span(name, memory):
+                        return await func(*args, **kwargs)
+
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.span(name, memory):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        """Return the statistics of every span that has completed at least once."""
+        with self._lock:
+            return [stats.summary() for _, stats in sorted(self._stats.items()) if stats.count]
+
+    def reset(self) -> None:
+        """Forget every recorded span."""
+        with self._lock:
+            self._stats.clear()
+
+    def export_json(self, path: str) -> None:
+        """Write the span statistics to a JSON file."""
+        with open(path, "w") as f:
+            json.dump(self.summaries(), f, indent=2)
+
+    def export_csv(self, path: str) -> None:
+        """Write the span statistics to a CSV file."""
+        rows = self.summaries()
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(SpanStats("", None).summary()))
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({**row, "top_lines": "; ".join(row["top_lines"])})
+
+
+# the registry used by timer, timed and output_performance_data
+profiler = Profiler()
 
 
-@contextlib.contextmanager
 def timer(
     context: str = "Time Overhead Measurement (ms)",
-) -> Generator[None, None, None]:
-    """Timing context manager for profiling code."""
-    # start the timer
-    start_time = perf_counter()
-    # yield control back to the context manager's caller
-    yield
-    # stop the timer
-    end_time = perf_counter()
-    # calculate the duration of the code block
-    duration = (end_time - start_time) * 1000
-    performance_data.append((context, duration))
-
-
-def output_performance_data(console: Console, label: str) -> None:
+    memory: Optional[bool] = None,
+) -> contextlib.AbstractContextManager:
+    """Timing context manager for profiling code, tracking allocations too when memory is set."""
+    return profiler.span(context, memory)
+
+
+def timed(context: Optional[str] = None, memory: Optional[bool] = None) -> Callable[[Callable], Callable]:
+    """Decorator form of timer."""
+    return profiler.timed(context, memory)
+
+
+def output_performance_data(console: Optional["Console"] = None, label: str = "") -> None:
     """Output the saved performance data."""
-    for context, duration in performance_data:
+    if console is None:
+        # rich is only needed when the report is printed
+        from rich.console import Console
+
+        console = Console()
+    for stats in profiler.summaries():
         console.print()
-        console.print(f"{label} {context}: {duration:.2f} ms")
+        console.print(
+            f"{label} {stats['context']}: {stats['total_ms']:.2f} ms "
+            f"({stats['count']} run(s), mean {stats['mean_ms']:.2f}, p95 {stats['p95_ms']:.2f} ms)"
+        )
+        if stats["peak_kib"] is not None:
+            rss = f", process peak RSS {stats['rss_peak_kib']:.0f} KiB" if stats["rss_peak_kib"] is not None else ""
+            console.print(f"{label} {stats['context']} memory: peak {stats['peak_kib']:.1f} KiB, net {stats['net_kib']:+.1f} KiB{rss}")
+            for line in stats["top_lines"]:
+                console.print(f"    {line}")
@@ -0,0 +1,366 @@
+"""Keep the ideal tests, the best ratios and coverage order statistics current as test results stream in."""
+
+import argparse
+import asyncio
+import heapq
+import json
+import math
+from bisect import bisect_left, bisect_right, insort
+from itertools import chain, islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fitness import coverage_per_second
+
+# Target size of each sublist of a SortedList
+LOAD = 512
+
+
+class SortedList:
+    """A sorted list kept in bounded sublists, so an insert or a removal only moves a few hundred items.
+
+    A Fenwick tree over the sublist sizes turns positions into sublists and back in O(log n).
+    """
+
+    def __init__(self, values: Iterable[Any] = ()) -> None:
+        values = sorted(values)
+        self._lists: List[List[Any]] = [values[i:i + LOAD] for i in range(0, len(values), LOAD)]
+        self._maxes: List[Any] = [sub[-1] for sub in self._lists]
+        self._len = len(values)
+        self._index: Optional[List[int]] = None  # the Fenwick tree, rebuilt after sublists split or vanish
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[Any]:
+        return chain.from_iterable(self._lists)
+
+    def __reversed__(self) -> Iterator[Any]:
+        return chain.from_iterable(reversed(sub) for sub in reversed(self._lists))
+
+    def add(self, value: Any) -> None:
+        """Insert a value in order."""
+        if not self._maxes:
+            self._lists.append([value])
+            self._maxes.append(value)
+            self._index = None
+        else:
+            i = bisect_left(self._maxes, value)
+            if i == len(self._maxes):
+                i -= 1
+                self._lists[i].append(value)
+                self._maxes[i] = value
+            else:
+                insort(self._lists[i], value)
+            if len(self._lists[i]) > 2 * LOAD:
+                # split an overfull sublist in half
+                sub = self._lists[i]
+                self._lists[i:i + 1] = [sub[:LOAD], sub[LOAD:]]
+                self._maxes[i:i + 1] = [sub[LOAD - 1], sub[-1]]
+                self._index = None
+            else:
+                self._update_index(i, 1)
+        self._len += 1
+
+    def remove(self, value: Any) -> None:
+        """Remove one occurrence of a value, raising ValueError when it is missing."""
+        i = bisect_left(self._maxes, value)
+        if i < len(self._maxes):
+            sub = self._lists[i]
+            j = bisect_left(sub, value)
+            if j < len(sub) and sub[j] == value:
+                del sub[j]
+                self._len -= 1
+                if sub:
+                    self._maxes[i] = sub[-1]
+                    self._update_index(i, -1)
+                else:
+                    del self._lists[i], self._maxes[i]
+                    self._index = None
+                return
+        raise ValueError(f"{value!r} is not in the list")
+
+    def _build_index(self) -> List[int]:
+        """Rebuild the Fenwick tree over the sublist sizes in O(n / LOAD)."""
+        tree = [0] + [len(sub) for sub in self._lists]
+        for node in range(1, len(tree)):
+            parent = node + (node & -node)
+            if parent < len(tree):
+                tree[parent] += tree[node]
+        self._index = tree
+        return tree
+
+    def _update_index(self, i: int, delta: int) -> None:
+        """Change the size of sublist i in the Fenwick tree, unless it is due for a rebuild anyway."""
+        tree = self._index
+        if tree is None:
+            return
+        node = i + 1
+        while node < len(tree):
+            tree[node] += delta
+            node += node & -node
+
+    def _position(self, i: int, j: int) -> int:
+        """Turn a sublist and an offset into a position in the whole list."""
+        tree = self._index or self._build_index()
+        node = i
+        while node:
+            j += tree[node]
+            node -= node & -node
+        return j
+
+    def _locate(self, index: int) -> Tuple[int, int]:
+        """Turn a position in the whole list into a sublist and an offset."""
+        tree = self._index or self._build_index()
+        # descend the tree, keeping the sublists that end at or before index
+        node = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            child = node + step
+            if child < len(tree) and tree[child] <= index:
+                node = child
+                index -= tree[child]
+            step >>= 1
+        return node, index
+
+    def bisect_left(self, value: Any) -> int:
+        """Return the number of values smaller than value."""
+        i = bisect_left(self._maxes, value)
+        return self._len if i == len(self._maxes) else self._position(i, bisect_left(self._lists[i], value))
+
+    def bisect_right(self, value: Any) -> int:
+        """Return the number of values smaller than or equal to value."""
+        i = bisect_right(self._maxes, value)
+        return self._len if i == len(self._maxes) else self._position(i, bisect_right(self._lists[i], value))
+
+    def __getitem__(self, index: int) -> Any:
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("SortedList index out of range")
+        i, j = self._locate(index)
+        return self._lists[i][j]
+
+    def irange(self, low: Any, high: Any) -> Iterator[Any]:
+        """Yield the values v with low <= v < high in order."""
+        i = bisect_left(self._maxes, low)
+        if i == len(self._maxes):
+            return
+        j = bisect_left(self._lists[i], low)
+        for sub in self._lists[i:]:
+            for value in sub[j:]:
+                if not value < high:
+                    return
+                yield value
+            j = 0
+
+
+class RankingService:
+    """Incrementally maintained rankings of the latest result of every test."""
+
+    def __init__(self) -> None:
+        self._tests: Dict[str, Tuple[float, float, Optional[str]]] = {}
+        # (duration, -coverage, name) of every test, and of the Pareto-optimal tests only
+        self._points = SortedList()
+        self._front = SortedList()
+        self._coverage = SortedList()  # (coverage, name) for the order statistics
+        self._ratios: List[Tuple[float, int, str]] = []  # max-heap of (-ratio, version, name)
+        self._versions: Dict[str, int] = {}
+        self._version = 0
+
+    def __len__(self) -> int:
+        return len(self._tests)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tests
+
+    def update(self, name: str, duration: float, coverage: float, outcome: Optional[str] = None) -> None:
+        """Insert a test result, or replace the previous result of the same test."""
+        if name in self._tests:
+            self.remove(name)
+        self._tests[name] = (duration, coverage, outcome)
+        point = (duration, -coverage, name)
+        self._points.add(point)
+        self._coverage.add((coverage, name))
+        self._version += 1
+        self._versions[name] = self._version
+        heapq.heappush(self._ratios, (-coverage_per_second(duration, coverage), self._version, name))
+        self._add_to_front(point)
+
+    def remove(self, name: str) -> None:
+        """Forget a test, raising KeyError when it is unknown."""
+        duration, coverage, _ = self._tests.pop(name)
+        point = (duration, -coverage, name)
+        self._points.remove(point)
+        self._coverage.remove((coverage, name))
+        del self._versions[name]  # its heap entry is now stale and skipped lazily
+        if self._on_front(point):
+            self._front.remove(point)
+            self._refill_front(point)
+        if len(self._ratios) > 2 * len(self._tests) + 64:
+            # drop the stale entries once they outnumber the live ones
+            self._ratios = [entry for entry in self._ratios if self._versions.get(entry[2]) == entry[1]]
+            heapq.heapify(self._ratios)
+
+    def _on_front(self, point: Tuple[float, float, str]) -> bool:
+        i = self._front.bisect_left(point)
+        return i < len(self._front) and self._front[i] == point
+
+    def _front_before(self, point: Tuple[Any, ...]) -> Optional[Tuple[float, float, str]]:
+        """Return the last front point that sorts before point."""
+        i = self._front.bisect_left(point)
+        return self._front[i - 1] if i else None
+
+    def _add_to_front(self, point: Tuple[float, float, str]) -> None:
+        """Place a new point on the front if nothing dominates it, evicting what it dominates."""
+        duration, loss, _ = point
+        # front points are ordered by duration with strictly falling loss, so the only
+        # candidate to dominate the new point is the last one that is not slower
+        best = self._front_before((duration, math.inf))
+        if best is not None and (best[1] < loss or (best[1] == loss and best[0] < duration)):
+            return
+        # the points it dominates are the slower front points with no better coverage
+        dominated = []
+        for other in self._front.irange((duration, -math.inf), (math.inf, math.inf)):
+            if other[1] < loss or (other[0], other[1]) == (duration, loss):
+                break
+            dominated.append(other)
+        for other in dominated:
+            self._front.remove(other)
+        self._front.add(point)
+
+    def _refill_front(self, removed: Tuple[float, float, str]) -> None:
+        """Promote the points that only the removed front point was dominating."""
+        duration, loss, _ = removed
+        if any(True for _ in self._front.irange((duration, loss), (duration, loss, "\U0010ffff"))):
+            return  # an identical point is still on the front and dominates the same points
+        previous = self._front_before((duration, loss))
+        i = self._front.bisect_left((duration, loss))
+        following = self._front[i] if i < len(self._front) else None
+        # only points strictly between the neighbouring front points can have been freed
+        low = (previous[0], math.inf) if previous is not None else (-math.inf,)
+        high = (following[0],) if following is not None else (math.inf,)
+        best_loss = previous[1] if previous is not None else math.inf
+        last = None
+        for point in self._points.irange(low, high):
+            if point[1] < best_loss:
+                best_loss = point[1]
+                last = point
+                self._front.add(point)
+            elif last is not None and point[:2] == last[:2]:
+                self._front.add(point)  # identical objectives share a front
+
+    def ideal(self) -> List[str]:
+        """Return the Pareto-optimal tests, fastest first."""
+        return [name for _, _, name in self._front]
+
+    def top_k(self, k: int = 1, by: str = "coverage") -> List[Dict[str, Any]]:
+        """Return the k best tests by coverage or by coverage per second, best first."""
+        if by == "coverage":
+            names = [name for _, name in islice(reversed(self._coverage), k)]
+        elif by == "ratio":
+            names = self._best_ratios(k)
+        else:
+            raise ValueError(f"Unknown ranking '{by}'")
+        return [self.get(name) for name in names]
+
+    def _best_ratios(self, k: int) -> List[str]:
+        """Pop the k best live ratio entries and push them back."""
+        taken = []
+        while self._ratios and len(taken) < k:
+            entry = heapq.heappop(self._ratios)
+            if self._versions.get(entry[2]) == entry[1]:
+                taken.append(entry)
+        for entry in taken:
+            heapq.heappush(self._ratios, entry)
+        return [name for _, _, name in taken]
+
+    def get(self, name: str) -> Dict[str, Any]:
+        """Return the latest result of a test."""
+        duration, coverage, outcome = self._tests[name]
+        return {"name": name, "duration": duration, "outcome": outcome, "coverage": coverage}
+
+    def rank(self, name: str) -> int:
+        """Return how many tests have a strictly higher coverage than the named test."""
+        coverage = self._tests[name][1]
+        return len(self._coverage) - self._coverage.bisect_right((coverage, "\U0010ffff"))
+
+    def kth(self, k: int) -> Dict[str, Any]:
+        """Return the test with the k-th highest coverage, counting from 0."""
+        return self.get(self._coverage[-1 - k][1])
+
+    def percentile(self, q: float) -> float:
+        """Return the coverage below which q percent of the tests fall."""
+        if not self._coverage:
+            return 0.0
+        return self._coverage[min(len(self._coverage) - 1, int(q / 100 * len(self._coverage)))][0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Summarize the current state."""
+        return {
+            "tests": len(self._tests),
+            "ideal": len(self._front),
+            "median_coverage": self.percentile(50),
+        }
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer one protocol request."""
+        op = request.get("op")
+        if op == "update":
+            for test in request["tests"] if "tests" in request else [request]:
+                self.update(test["name"], float(test["duration"]), float(test["coverage"]), test.get("outcome"))
+            return {"ok": True, "tests": len(self)}
+        if op == "remove":
+            self.remove(request["name"])
+            return {"ok": True, "tests": len(self)}
+        if op == "ideal":
+            return {"ok": True, "ideal": self.ideal()}
+        if op == "top_k":
+            return {"ok": True, "tests": self.top_k(int(request.get("k", 1)), request.get("by", "coverage"))}
+        if op == "rank":
+            return {"ok": True, "rank": self.rank(request["name"])}
+        if op == "stats":
+            return {"ok": True, **self.stats()}
+        raise ValueError(f"Unknown operation '{op}'")
+
+
+async def _serve_client(service: RankingService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Answer JSON requests, one per line, until the client disconnects."""
+    try:
+        while line := await reader.readline():
+            try:
+                response = service.handle(json.loads(line))
+            except (KeyError, TypeError, ValueError) as error:
+                response = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(service: RankingService, host: str = "127.0.0.1", port: int = 8765) -> None:
+    """Serve the ranking service over a local socket speaking JSON Lines."""
+    server = await asyncio.start_server(lambda r, w: _serve_client(service, r, w), host, port)
+    print(f"Ranking service listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Start the ranking service, optionally seeded from a metrics file."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--load", help="metrics file to seed the rankings with")
+    args = parser.parse_args(argv)
+
+    service = RankingService()
+    if args.load:
+        from metrics_cache import iter_rows
+
+        for name, duration, coverage, outcome in iter_rows(args.load):
+            service.update(name, duration, coverage, outcome)
+    asyncio.run(serve(service, args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Select the best tests by any metric in a single pass without sorting them."""
+
+import heapq
+from itertools import count
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+def top_k(
+    tests: Iterable[Dict[str, Any]],
+    key: str,
+    k: int = 1,
+    largest: bool = True,
+    outcome: Optional[str] = None,
+    keep_ties: bool = False,
+) -> List[Dict[str, Any]]:
+    """Return the k best tests by key, best first, using a bounded heap."""
+    if k < 1:
+        return []
+    sign = 1 if largest else -1  # the heap always keeps the largest signed keys
+    order = count()  # earlier tests win ties, like a strict comparison scan
+    heap: List[Any] = []  # the worst kept test sits at the root
+    tied: List[Any] = []  # tests pushed out of the heap that equal its worst key
+
+    for test in tests:
+        if outcome is not None and test.get("outcome") != outcome:
+            continue  # skip tests with a different outcome
+        entry = (sign * test[key], -next(order), test)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry[0] > heap[0][0]:
+            dropped = heapq.heappushpop(heap, entry)
+            if keep_ties and dropped[0] == heap[0][0]:
+                tied.append(dropped)  # still as good as the new worst kept test
+            else:
+                tied = []  # the cut-off moved past every earlier tie
+        elif keep_ties and entry[0] == heap[0][0]:
+            tied.append(entry)
+
+    # best first, and in input order among equal keys
+    ranked = sorted(heap + tied, key=lambda entry: (-entry[0], -entry[1]))
+    return [test for _, _, test in ranked]
+
+
+def best_test(
+    tests: Iterable[Dict[str, Any]],
+    key: str,
+    largest: bool = True,
+    outcome: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """Return the single best test by key, or None if no test qualifies."""
+    best = top_k(tests, key, 1, largest, outcome)
+    return best[0] if best else None
+
+
+def top_k_indices(
+    values: np.ndarray,
+    k: int = 1,
+    largest: bool = True,
+    mask: Optional[np.ndarray] = None,
+    keep_ties: bool = False,
+) -> np.ndarray:
+    """Return the indices of the k best values, best first, using a linear-time partition."""
+    candidates = np.arange(len(values)) if mask is None else np.flatnonzero(mask)
+    signed = values[candidates] if largest else -values[candidates]
+    k = min(k, len(candidates))
+    if k < 1:
+        return np.empty(0, dtype=np.int64)
+    if k == 1 and not keep_ties:
+        return candidates[[np.argmax(signed)]]  # the first of equal best values, like a scan
+    # partition in linear time only to find the cut-off value, the k-th best
+    cutoff = np.partition(signed, len(signed) - k)[len(signed) - k]
+    better = np.flatnonzero(signed > cutoff)
+    tied = np.flatnonzero(signed == cutoff)  # in input order, so earlier tests win ties
+    if not keep_ties:
+        tied = tied[:k - len(better)]
+    chosen = np.concatenate((better, tied))
+    chosen = chosen[np.lexsort((chosen, -signed[chosen]))]
+    return candidates[chosen]
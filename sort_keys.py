@@ -0,0 +1,105 @@
+"""Shared multi-key sort specifications for the sorting modules."""
+
+from numbers import Number
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+
+# A sort key is a dotted path such as "coverage.lines", optionally prefixed with "-"
+# for descending order, or a (path, "asc" | "desc") pair
+SortKey = Union[str, Tuple[str, str]]
+SortSpec = Union[SortKey, Sequence[SortKey]]
+
+
+class Descending:
+    """Wraps a non-numeric value so that it compares in reverse order."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __lt__(self, other: "Descending") -> bool:
+        return other.value < self.value
+
+    def __gt__(self, other: "Descending") -> bool:
+        return other.value > self.value
+
+    def __le__(self, other: "Descending") -> bool:
+        return other.value <= self.value
+
+    def __ge__(self, other: "Descending") -> bool:
+        return other.value >= self.value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Descending) and self.value == other.value
+
+    def __hash__(self) -> int:
+        return hash(self.value)
+
+
+def parse_sort_spec(spec: SortSpec) -> List[Tuple[List[str], bool]]:
+    """Turn a sort specification into (path parts, descending) pairs."""
+    if isinstance(spec, str) or (isinstance(spec, tuple) and len(spec) == 2 and spec[1] in ("asc", "desc")):
+        spec = [spec]
+    parsed = []
+    for key in spec:
+        if isinstance(key, str):
+            descending = key.startswith("-")
+            path = key[1:] if descending else key
+        else:
+            path, direction = key
+            if direction not in ("asc", "desc"):
+                raise ValueError(f"Unknown sort direction '{direction}' for key '{path}'")
+            descending = direction == "desc"
+        if not path:
+            raise ValueError("Sort keys must name an attribute")
+        parsed.append((path.split("."), descending))
+    if not parsed:
+        raise ValueError("At least one sort key is required")
+    return parsed
+
+
+def metric_value(value: Any) -> Any:
+    """Turn a metric into a sortable value, summing the entries of nested dictionaries."""
+    return sum(value.values()) if isinstance(value, dict) else value
+
+
+def _compile_one(parts: List[str], descending: bool) -> Callable[[Dict[str, Any]], Any]:
+    """Build the accessor for one dotted path and direction."""
+    if len(parts) == 1:
+        name = parts[0]
+
+        def lookup(test: Dict[str, Any]) -> Any:
+            return metric_value(test[name])
+    else:
+        def lookup(test: Dict[str, Any]) -> Any:
+            value: Any = test
+            for part in parts:
+                value = value[part]
+            return metric_value(value)
+
+    if not descending:
+        return lookup
+
+    def reversed_lookup(test: Dict[str, Any]) -> Any:
+        value = lookup(test)
+        # numbers are negated so they keep their fast comparisons
+        return -value if isinstance(value, Number) else Descending(value)
+
+    return reversed_lookup
+
+
+def compile_sort_keys(spec: SortSpec) -> List[Callable[[Dict[str, Any]], Any]]:
+    """Compile a sort specification into one ascending accessor per key."""
+    return [_compile_one(parts, descending) for parts, descending in parse_sort_spec(spec)]
+
+
+def compile_sort_key(spec: SortSpec) -> Callable[[Dict[str, Any]], Any]:
+    """Compile a sort specification into a single ascending key function.
+
+    A single key yields its value directly, several keys yield a tuple that
+    orders the tests lexicographically in one pass.
+    """
+    accessors = compile_sort_keys(spec)
+    if len(accessors) == 1:
+        return accessors[0]
+    return lambda test: tuple(accessor(test) for accessor in accessors)
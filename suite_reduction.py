@@ -0,0 +1,172 @@
+"""Per-test covered-line bitsets and a greedy set-cover selector for a reduced test suite."""
+
+import argparse
+import heapq
+import json
+import math
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from metrics_io import iter_test_metrics
+
+# int.bit_count arrived in Python 3.10
+popcount = getattr(int, "bit_count", None) or (lambda bits: bin(bits).count("1"))
+
+
+class CoverageBitsets:
+    """The lines every test covers, one bit per line, with each file owning a contiguous run of bits."""
+
+    def __init__(self, files: List[Tuple[str, List[int]]], tests: Dict[str, int]) -> None:
+        self.files = files  # (path, sorted line numbers) in bit order
+        self.tests = tests  # test name -> bitset as a Python int
+        self.lines = dict(files)
+        self.offsets: Dict[str, int] = {}
+        offset = 0
+        for path, lines in files:
+            self.offsets[path] = offset
+            offset += len(lines)
+        self.size = offset
+
+    @classmethod
+    def from_coverage(cls, coverage_data: Dict[str, Any]) -> "CoverageBitsets":
+        """Build the bitsets from a coverage.json with per-test contexts."""
+        files = []
+        tests: Dict[str, int] = {}
+        offset = 0
+        for file_path, file_data in coverage_data.get("files", {}).items():
+            lines = sorted(file_data.get("lines", {}), key=int)
+            for bit, line_num in enumerate(lines, offset):
+                for test_name in set(file_data["lines"][line_num].get("tests", [])):
+                    tests[test_name] = tests.get(test_name, 0) | (1 << bit)
+            files.append((file_path, [int(line_num) for line_num in lines]))
+            offset += len(lines)
+        return cls(files, tests)
+
+    def file_bits(self, path: str, bits: int) -> int:
+        """Return the part of a bitset that belongs to one file, shifted down to bit 0."""
+        return (bits >> self.offsets[path]) & ((1 << len(self.lines[path])) - 1)
+
+    def covered_lines(self, test_name: str) -> Dict[str, List[int]]:
+        """Return the line numbers a test covers, per file."""
+        bits = self.tests.get(test_name, 0)
+        covered = {}
+        for path, lines in self.files:
+            file_bits = self.file_bits(path, bits)
+            if file_bits:
+                covered[path] = [line for i, line in enumerate(lines) if file_bits >> i & 1]
+        return covered
+
+    def union(self, test_names: Iterable[str]) -> int:
+        """Return the lines covered by any of the tests."""
+        bits = 0
+        for test_name in test_names:
+            bits |= self.tests.get(test_name, 0)
+        return bits
+
+    def to_json(self) -> Dict[str, Any]:
+        """Return a JSON-ready form, with every bitset as a hex string."""
+        return {
+            "files": [{"path": path, "lines": lines} for path, lines in self.files],
+            "tests": {test_name: format(bits, "x") for test_name, bits in self.tests.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "CoverageBitsets":
+        """Rebuild the bitsets from their JSON form."""
+        files = [(entry["path"], entry["lines"]) for entry in data["files"]]
+        return cls(files, {test_name: int(bits, 16) for test_name, bits in data["tests"].items()})
+
+    def save(self, output_file: Union[str, Path]) -> None:
+        """Write the bitsets to a JSON file."""
+        with open(output_file, "w") as f:
+            json.dump(self.to_json(), f)
+
+    @classmethod
+    def load(cls, input_file: Union[str, Path]) -> "CoverageBitsets":
+        """Read bitsets written by save."""
+        with open(input_file, "r") as f:
+            return cls.from_json(json.load(f))
+
+
+def _cost(duration: float) -> float:
+    """Keep zero-duration tests selectable without dividing by zero."""
+    return max(duration, 1e-9)
+
+
+def select_suite(
+    bitsets: CoverageBitsets,
+    durations: Dict[str, float],
+    target: float = 1.0,
+    lazy: bool = True,
+) -> Dict[str, Any]:
+    """Greedily pick tests by new lines per second until they cover target of what the whole suite covers."""
+    candidates = [name for name in durations if bitsets.tests.get(name)]
+    reachable = popcount(bitsets.union(candidates))
+    needed = min(reachable, math.ceil(target * reachable - 1e-9))  # round up so the target is really met
+    covered = 0
+    covered_lines = 0
+    chosen: List[str] = []
+
+    if lazy:
+        # gains only shrink as lines get covered, so a stale heap entry is an upper bound
+        # and a test whose fresh score still beats the next entry is the true best
+        heap = [
+            (-popcount(bitsets.tests[name]) / _cost(durations[name]), position, name)
+            for position, name in enumerate(candidates)
+        ]
+        heapq.heapify(heap)
+        while heap and covered_lines < needed:
+            _, position, name = heapq.heappop(heap)
+            gain = popcount(bitsets.tests[name] & ~covered)
+            if not gain:
+                continue
+            entry = (-gain / _cost(durations[name]), position, name)
+            if heap and entry > heap[0]:
+                heapq.heappush(heap, entry)
+                continue
+            covered |= bitsets.tests[name]
+            covered_lines += gain
+            chosen.append(name)
+    else:
+        remaining = dict(enumerate(candidates))
+        while remaining and covered_lines < needed:
+            # rescore every remaining test each round
+            def score(position: int) -> Tuple[float, int]:
+                name = remaining[position]
+                return -popcount(bitsets.tests[name] & ~covered) / _cost(durations[name]), position
+
+            best = min(remaining, key=score)
+            name = remaining.pop(best)
+            gain = popcount(bitsets.tests[name] & ~covered)
+            if not gain:
+                break
+            covered |= bitsets.tests[name]
+            covered_lines += gain
+            chosen.append(name)
+
+    return {
+        "tests": chosen,
+        "duration": sum(durations[name] for name in chosen),
+        "suite_duration": sum(durations.values()),
+        "covered_lines": covered_lines,
+        "reachable_lines": reachable,
+        "coverage": covered_lines / reachable if reachable else 1.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Print the reduced suite for the collected metrics and bitsets."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bitsets", default="test_metrics/coverage_bitsets.json", help="bitsets written by the collector")
+    parser.add_argument("--metrics", default="test_metrics/test_metrics.json", help="test metrics with the durations")
+    parser.add_argument("--target", type=float, default=1.0, help="fraction of the suite's coverage to keep")
+    parser.add_argument("--eager", action="store_true", help="rescore every test each round instead of lazily")
+    args = parser.parse_args(argv)
+
+    bitsets = CoverageBitsets.load(args.bitsets)
+    durations = {test["name"]: test["duration"] for test in iter_test_metrics(args.metrics) if test.get("outcome") == "passed"}
+    print(json.dumps(select_suite(bitsets, durations, args.target, lazy=not args.eager), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Check the batched binary tournament against the reference loop."""
+
+import ast
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nsga2_algorithm import (
+    all_pairs,
+    binary_tournament,
+    binary_tournament_batched,
+    pair_chunks,
+    run_tournaments,
+    stream_tournaments,
+)
+
+pymoo = pytest.importorskip("pymoo")
+from pymoo.core.individual import Individual  # noqa: E402
+from pymoo.core.population import Population  # noqa: E402
+
+
+def random_population(rng: np.random.Generator, n: int) -> Population:
+    """Build a population with few distinct fitness values and repeated names."""
+    individuals = []
+    for _ in range(n):
+        ind = Individual(X=[1.0, 1.0])
+        ind.name = f"t{rng.integers(0, n)}"  # names repeat, like parametrized tests sharing a node id
+        ind.F = float(rng.integers(0, 5))  # ties between competitors are common
+        individuals.append(ind)
+    return Population(individuals)
+
+
+def test_batched_tournament_matches_reference(capsys):
+    rng = np.random.default_rng(0)
+    compared = 0
+    for _ in range(400):
+        n = int(rng.integers(1, 12))
+        pop = random_population(rng, n)
+        P = rng.integers(0, n, size=(int(rng.integers(1, 40)), 2))
+
+        try:
+            expected_S = binary_tournament(pop, P)
+        except ValueError:
+            # the reference cannot remove a loser that is not on its list; the batched
+            # version treats that removal as a no-op, so there is nothing to compare
+            capsys.readouterr()
+            continue
+        expected_list = ast.literal_eval(capsys.readouterr().out.split(": ", 1)[1])
+
+        S = binary_tournament_batched(pop, P)
+        capsys.readouterr()
+        fitness = np.asarray(pop.get("F"), dtype=float).reshape(-1)
+        _, winner_list = run_tournaments(fitness, pop.get("name"), P)
+
+        assert np.array_equal(S, expected_S)
+        assert winner_list == expected_list
+        assert all(type(name) is str for name in winner_list)  # plain strings, not np.str_
+        compared += 1
+
+    # about a third of the random cases are accepted by the reference, enough to make this meaningful
+    assert compared > 100
+
+
+def test_long_removal_chain_matches_reference(capsys):
+    # e > s > x0 > x1 > ... > d by fitness; s drops x0, then every x drops the next one,
+    # a chain far longer than the masked passes settle before the sequential replay
+    k = 300
+    x, d, s, e = list(range(k)), k, k + 1, k + 2
+    fitness = [float(k + 1 - i) for i in x] + [0.0, float(k + 2), float(k + 3)]
+    pairs = [(i, d) for i in x] + [(e, s), (s, 0)] + [(i - 1, i) for i in x[1:]]
+    individuals = []
+    for position, value in enumerate(fitness):
+        ind = Individual(X=[1.0, 1.0])
+        ind.name = f"t{position}"
+        ind.F = value
+        individuals.append(ind)
+    pop, P = Population(individuals), np.array(pairs)
+
+    binary_tournament(pop, P)
+    expected_list = ast.literal_eval(capsys.readouterr().out.split(": ", 1)[1])
+    _, winner_list = run_tournaments(np.array(fitness), pop.get("name"), P)
+
+    assert winner_list == expected_list == [f"t{e}"]
+
+
+@pytest.mark.parametrize("n, chunk_size", [(0, 3), (1, 3), (2, 1), (9, 4), (30, 7), (30, 1000)])
+def test_pair_chunks_stream_all_pairs(n, chunk_size):
+    chunks = list(pair_chunks(n, chunk_size))
+    assert all(1 <= len(chunk) <= chunk_size for chunk in chunks)
+    streamed = np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int64)
+    assert np.array_equal(streamed, all_pairs(n))
+
+
+def test_streamed_tournaments_match_the_full_matrix():
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        n = int(rng.integers(2, 40))
+        fitness = rng.integers(0, 6, n).astype(float)
+        names = np.array([f"t{rng.integers(0, n)}" for _ in range(n)])
+        _, expected = run_tournaments(fitness, names, all_pairs(n))
+        assert stream_tournaments(fitness, names, pair_chunks(n, int(rng.integers(1, 50)))) == expected
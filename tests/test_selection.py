@@ -0,0 +1,30 @@
+"""Check the column selection against the heap selection on tied values."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from selection import top_k, top_k_indices
+
+
+@pytest.mark.parametrize("keep_ties", [False, True])
+@pytest.mark.parametrize("largest", [True, False])
+def test_top_k_indices_matches_top_k(largest: bool, keep_ties: bool) -> None:
+    rng = np.random.default_rng(0)
+    for case in range(500):
+        n = int(rng.integers(0, 40))
+        values = rng.integers(0, 5, n).astype(float)  # few distinct values, so the cut-off is often tied
+        mask = rng.random(n) < 0.7 if case % 2 else None
+        k = int(rng.integers(0, 8))
+        tests = [
+            {"index": i, "value": values[i], "outcome": "passed" if mask is None or mask[i] else "failed"}
+            for i in range(n)
+        ]
+        outcome = None if mask is None else "passed"
+        expected = [test["index"] for test in top_k(tests, "value", k, largest, outcome, keep_ties)]
+        assert top_k_indices(values, k, largest, mask, keep_ties).tolist() == expected